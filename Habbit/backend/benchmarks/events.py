@@ -0,0 +1,101 @@
+"""Benchmark: EventHub with thousands of idle SSE subscribers in one worker.
+
+Each subscriber is a task draining server.user_event_stream, which is what
+StreamingResponse does for a connected client minus the socket. Run from the
+backend directory:
+
+    python benchmarks/events.py --subscribers 5000 --users 1000 --idle 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+async def consume(user_id: str, received: dict, events_seen: asyncio.Event, expected: int):
+    async for frame in server.user_event_stream(user_id):
+        if frame.startswith(b"event:"):
+            received["events"] += 1
+            if received["events"] >= expected:
+                events_seen.set()
+        elif frame.startswith(b":"):
+            received["heartbeats"] += 1
+
+async def measure_loop_lag(duration: float, interval: float = 0.01):
+    """Worst and median lateness of a periodic sleep, a proxy for event loop load"""
+    lags = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+    return max(lags), statistics.median(lags)
+
+def _time_publish(user_id: str, payload: dict) -> float:
+    started = time.perf_counter()
+    server.event_hub.publish(user_id, "progress", payload)
+    return time.perf_counter() - started
+
+async def run(args):
+    server.EVENT_HEARTBEAT_SECONDS = args.heartbeat
+    user_ids = [f"bench-user-{i}" for i in range(args.users)]
+    received = {"events": 0, "heartbeats": 0}
+    events_seen = asyncio.Event()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tasks = [
+        asyncio.create_task(consume(user_ids[i % args.users], received, events_seen, args.subscribers))
+        for i in range(args.subscribers)
+    ]
+    # Let every consumer reach its first queue wait
+    for _ in range(3):
+        await asyncio.sleep(0)
+    subscribed_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    stats = server.event_hub.stats()
+    print(f"{stats['subscribers']} subscribers across {stats['users']} users, heartbeat {args.heartbeat}s")
+    print(f"  memory per idle subscriber: {subscribed_bytes / args.subscribers / 1024:.1f} KiB")
+
+    max_lag, median_lag = await measure_loop_lag(args.idle)
+    print(f"  idle {args.idle}s: {received['heartbeats']} heartbeats, "
+          f"loop lag median {median_lag * 1000:.2f} ms / max {max_lag * 1000:.2f} ms")
+
+    # One event to every user, i.e. one frame to every subscriber
+    payload = {"completions": 1, "xp_earned": 20, "total_xp": 1200, "current_level": 4,
+               "level_up": False, "current_streak": 7}
+    started = time.perf_counter()
+    for user_id in user_ids:
+        server.event_hub.publish(user_id, "progress", payload)
+    published = time.perf_counter() - started
+    await asyncio.wait_for(events_seen.wait(), timeout=60)
+    delivered = time.perf_counter() - started
+    print(f"  broadcast to all users: publish {published * 1000:.1f} ms, "
+          f"all {received['events']} frames drained {delivered * 1000:.1f} ms")
+
+    single = min(_time_publish(user_ids[0], payload) for _ in range(args.repeat))
+    print(f"  single publish to {args.subscribers // args.users} subscribers: {single * 1e6:.1f} us")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"  after disconnect: {server.event_hub.stats()['subscribers']} subscribers")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--heartbeat", type=float, default=1.0)
+    parser.add_argument("--idle", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
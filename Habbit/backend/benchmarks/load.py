@@ -0,0 +1,310 @@
+"""Load test: seed a database, then drive the hot API routes concurrently.
+
+Runs the FastAPI app in-process over httpx's ASGI transport, against either
+an in-memory mongomock-motor database (the default), a real MongoDB given
+with --mongo-url, or the in-memory storage engine with --engine memory.
+The AI client is replaced by a stub with a fixed latency. Reports latency
+percentiles, requests/sec and Mongo operations per request for each route.
+Run from the backend directory:
+
+    python benchmarks/load.py --users 50 --habits 8 --days 30 --requests 500 --concurrency 20
+    python benchmarks/load.py --mongo-url mongodb://localhost:27017 --output before.json
+    python benchmarks/load.py --mongo-url mongodb://localhost:27017 --compare before.json
+    python benchmarks/load.py --engine memory
+
+--mongo-url drops and reseeds the --db-name database (habitverse_bench by default).
+
+mongomock executes every operation synchronously, so requests never overlap
+on the event loop: its latencies are per-request CPU cost and its operation
+counts are exact, but only a real server shows the effect of concurrency.
+The memory engine issues no Mongo operations, so it reports 0 ops/request.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from pymongo import monitoring  # noqa: E402
+
+import server  # noqa: E402
+from storage import MemoryStorage, MotorStorage  # noqa: E402
+
+CATEGORIES = ["fitness", "focus", "sleep", "wellness", "productivity"]
+ROUTES = ["complete_habit", "get_dashboard", "get_analytics", "get_user_habits"]
+
+# Query logs of the requests issued by the current worker, filled in by the
+# metrics middleware (server.MetricsRegistry listeners)
+current_ops: contextvars.ContextVar = contextvars.ContextVar("current_ops", default=None)
+
+def collect_request_metrics(method: str, route: str, metrics):
+    ops = current_ops.get()
+    if ops is not None:
+        ops.append(metrics)
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts wire commands (including getMore) when running against a real server"""
+
+    def __init__(self):
+        self.commands = 0
+
+    def started(self, event):
+        self.commands += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class StubCompletions:
+    """Stands in for openai_client.chat.completions with a fixed latency"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        if "JSON array" in kwargs["messages"][0]["content"]:
+            content = json.dumps([
+                {"name": "Stretch", "description": "Five minutes of stretching", "category": "fitness"}
+            ])
+        else:
+            content = "Nice consistency this week, keep it going!"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def connect(args):
+    """Point server.storage at the benchmark engine; returns the wire command counter, if any"""
+    if args.engine == "memory":
+        server.storage = MemoryStorage()
+        return None, None
+
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        counter = CommandCounter()
+        client = AsyncIOMotorClient(args.mongo_url, event_listeners=[counter])
+        server.storage = MotorStorage(server.InstrumentedDatabase(client[args.db_name]))
+        return counter, client
+
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("mongomock-motor is not installed; pip install mongomock-motor or pass --mongo-url")
+    server.storage = MotorStorage(server.InstrumentedDatabase(AsyncMongoMockClient()[args.db_name]))
+    return None, None
+
+async def seed(args, rng: random.Random):
+    """Create users with habits, completion history and moods, then derive rollups and counters"""
+    now = datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    users, habits_by_user = [], {}
+    habits, completions, moods = [], [], []
+
+    for u in range(args.users):
+        user = server.User(username=f"bench{u}", email=f"bench{u}@example.com").dict()
+        users.append(user)
+        user_habits = []
+        for h in range(args.habits):
+            difficulty = rng.randint(1, 5)
+            habit = server.Habit(
+                user_id=user["id"], name=f"habit {h}", description="benchmark habit",
+                category=rng.choice(CATEGORIES), difficulty=difficulty,
+                created_at=today - timedelta(days=args.days + 1)
+            ).dict()
+            habit["xp_reward"] = difficulty * 10
+            user_habits.append(habit)
+        habits.extend(user_habits)
+        habits_by_user[user["id"]] = [h["id"] for h in user_habits]
+
+        # History ends yesterday so complete_habit has work to do today
+        for day in range(args.days, 0, -1):
+            moment = today - timedelta(days=day) + timedelta(hours=rng.randint(6, 22))
+            for habit in user_habits:
+                if rng.random() < args.completion_rate:
+                    completions.append(server.HabitCompletion(
+                        user_id=user["id"], habit_id=habit["id"], completed_at=moment,
+                        completed_on=server.day_key(moment), xp_earned=habit["xp_reward"]
+                    ).dict())
+            moods.append(server.MoodEntry(
+                user_id=user["id"], mood_rating=rng.randint(1, 5),
+                energy_level=rng.randint(1, 5), created_at=moment
+            ).dict())
+
+    xp_by_user = {}
+    for completion in completions:
+        xp_by_user[completion["user_id"]] = xp_by_user.get(completion["user_id"], 0) + completion["xp_earned"]
+    for user in users:
+        user["total_xp"] = xp_by_user.get(user["id"], 0)
+
+    # Bulk load first, then build indexes, as for any large import
+    for user in users:
+        await server.storage.users.insert(user)
+    for repository, docs in ((server.storage.habits, habits), (server.storage.completions, completions),
+                             (server.storage.moods, moods)):
+        for start in range(0, len(docs), 5000):
+            await repository.insert_many(docs[start:start + 5000])
+    await server.storage.ensure_indexes()
+
+    await server.rebuild_daily_rollups()
+    await server.repair_user_counters()
+    for user in users:
+        await server.rebuild_user_streak(user["id"])
+
+    return habits_by_user, len(completions), len(moods)
+
+def make_request(route: str, user_id: str, habit_ids, rng: random.Random):
+    if route == "complete_habit":
+        habit_id = rng.choice(habit_ids)
+        return "POST", f"/api/habits/{habit_id}/complete", {"user_id": user_id, "habit_id": habit_id}
+    if route == "get_dashboard":
+        return "GET", f"/api/dashboard/{user_id}", None
+    if route == "get_analytics":
+        return "GET", f"/api/analytics/{user_id}", None
+    return "GET", f"/api/habits/{user_id}", None
+
+async def drive(client: httpx.AsyncClient, route: str, habits_by_user, args, rng: random.Random):
+    """Issue args.requests calls to one route from args.concurrency workers"""
+    user_ids = list(habits_by_user)
+    latencies, op_counts, errors = [], [], 0
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            user_id = rng.choice(user_ids)
+            method, path, body = make_request(route, user_id, habits_by_user[user_id], rng)
+            ops = []
+            token = current_ops.set(ops)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+            finally:
+                latencies.append(time.perf_counter() - started)
+                current_ops.reset(token)
+            op_counts.append(sum(len(metrics.queries) for metrics in ops))
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "mongo_ops_mean": statistics.mean(op_counts),
+        "mongo_ops_max": max(op_counts),
+    }
+
+def print_results(results, baseline=None):
+    header = f"{'route':<16} {'reqs':>6} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ops/req':>8} {'max':>4}"
+    print(header)
+    print("-" * len(header))
+    for route, r in results.items():
+        print(f"{route:<16} {r['requests']:>6} {r['errors']:>4} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['mongo_ops_mean']:>8.2f} {r['mongo_ops_max']:>4}")
+        if r.get("wire_commands_mean") is not None:
+            print(f"{'':<16} wire commands/req incl. getMore: {r['wire_commands_mean']:.2f}")
+        if baseline and route in baseline:
+            b = baseline[route]
+            print(f"{'  vs baseline':<16} {'':>6} {'':>4} {_delta(r['rps'], b['rps']):>8} "
+                  f"{_delta(r['p50_ms'], b['p50_ms']):>8} {_delta(r['p95_ms'], b['p95_ms']):>8} "
+                  f"{_delta(r['p99_ms'], b['p99_ms']):>8} {_delta(r['mongo_ops_mean'], b['mongo_ops_mean']):>8}")
+
+def engine_label(args) -> str:
+    if args.engine == "memory":
+        return "memory engine"
+    return "mongodb" if args.mongo_url else "mongomock"
+
+def _delta(value: float, base: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(value - base) / base * 100:+.0f}%"
+
+async def run(args):
+    rng = random.Random(args.seed)
+    server.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(args.ai_latency)))
+    if args.no_cache:
+        server.user_cache.cache.ttl_seconds = 0
+        server.active_habits_cache.cache.ttl_seconds = 0
+
+    server.metrics_registry.listeners.append(collect_request_metrics)
+    command_counter, client = connect(args)
+    if client is not None:
+        await client.drop_database(args.db_name)
+
+    started = time.perf_counter()
+    habits_by_user, completion_count, mood_count = await seed(args, rng)
+    print(f"seeded {args.users} users, {args.users * args.habits} habits, {completion_count} completions, "
+          f"{mood_count} moods in {time.perf_counter() - started:.1f}s "
+          f"({engine_label(args)}, AI stub {args.ai_latency * 1000:.0f} ms)")
+    print(f"{args.requests} requests per route, concurrency {args.concurrency}\n")
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for route in args.routes:
+            commands_before = command_counter.commands if command_counter else 0
+            results[route] = await drive(http, route, habits_by_user, args, rng)
+            if command_counter:
+                results[route]["wire_commands_mean"] = (command_counter.commands - commands_before) / args.requests
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+                       "results": results}, f, indent=2)
+        print(f"\nwrote {args.output}")
+
+    if client is not None:
+        client.close()
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("server").setLevel(logging.ERROR)
+    # server.py still uses pydantic's v1-style .dict()
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--habits", type=int, default=8, help="habits per user")
+    parser.add_argument("--days", type=int, default=30, help="days of seeded history")
+    parser.add_argument("--completion-rate", type=float, default=0.6, help="chance a habit was done on a seeded day")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("--ai-latency", type=float, default=0.05, help="stub AI call latency in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="disable the user/habit document cache")
+    parser.add_argument("--engine", choices=["mongo", "memory"], default="mongo", help="storage engine to benchmark")
+    parser.add_argument("--mongo-url", help="benchmark a real MongoDB instead of mongomock")
+    parser.add_argument("--db-name", default="habitverse_bench")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results from an earlier run to diff against")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
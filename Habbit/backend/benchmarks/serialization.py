@@ -0,0 +1,94 @@
+"""Micro-benchmark: legacy serialize_doc + jsonable_encoder path vs ORJSONResponse.
+
+Run from the backend directory:
+
+    python benchmarks/serialization.py --docs 10000 --repeat 5
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+def legacy_serialize_doc(doc):
+    """The recursive serializer server.py used before documents were projected"""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [legacy_serialize_doc(item) for item in doc]
+    if isinstance(doc, dict):
+        result = {}
+        for key, value in doc.items():
+            if key == '_id':
+                continue
+            if isinstance(value, ObjectId):
+                result[key] = str(value)
+            elif isinstance(value, datetime):
+                result[key] = value.isoformat()
+            elif isinstance(value, dict):
+                result[key] = legacy_serialize_doc(value)
+            elif isinstance(value, list):
+                result[key] = legacy_serialize_doc(value)
+            else:
+                result[key] = value
+        return result
+    return doc
+
+def make_completions(count: int, with_object_id: bool):
+    """Completion documents as Motor returns them, with or without _id"""
+    start = datetime.utcnow() - timedelta(days=365)
+    docs = []
+    for i in range(count):
+        completed_at = start + timedelta(minutes=i)
+        doc = {
+            "id": str(uuid.uuid4()),
+            "user_id": "bench-user",
+            "habit_id": str(uuid.uuid4()),
+            "completed_at": completed_at,
+            "completed_on": completed_at.strftime("%Y-%m-%d"),
+            "xp_earned": 20,
+            "mood_rating": 4,
+            "energy_level": 3,
+            "notes": None
+        }
+        if with_object_id:
+            doc["_id"] = ObjectId()
+        docs.append(doc)
+    return docs
+
+def legacy_path(docs):
+    return JSONResponse(jsonable_encoder(legacy_serialize_doc(docs))).body
+
+def fast_path(docs):
+    return ORJSONResponse(docs).body
+
+def best_of(func, docs, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(docs)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    legacy_docs = make_completions(args.docs, with_object_id=True)
+    projected_docs = make_completions(args.docs, with_object_id=False)
+    
+    legacy = best_of(legacy_path, legacy_docs, args.repeat)
+    fast = best_of(fast_path, projected_docs, args.repeat)
+    
+    print(f"{args.docs} documents, best of {args.repeat}")
+    print(f"  serialize_doc + jsonable_encoder + json: {legacy * 1000:8.1f} ms  ({len(legacy_path(legacy_docs))} bytes)")
+    print(f"  projected + orjson:                      {fast * 1000:8.1f} ms  ({len(fast_path(projected_docs))} bytes)")
+    print(f"  speedup: {legacy / fast:.1f}x")
+
+if __name__ == "__main__":
+    main()
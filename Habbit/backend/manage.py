@@ -0,0 +1,82 @@
+"""Maintenance commands for the HabitVerse backend.
+
+Run from the backend directory, e.g. ``python manage.py backfill-rollups``.
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+import server
+
+cli = typer.Typer(help="HabitVerse maintenance commands")
+
+@cli.callback()
+def main():
+    """HabitVerse maintenance commands"""
+
+@cli.command("backfill-rollups")
+def backfill_rollups(
+    user_id: Optional[str] = typer.Option(None, help="Only rebuild this user's rollups"),
+    batch_size: int = typer.Option(1000, help="Rollup upserts per bulk write")
+):
+    """Rebuild daily_rollups from raw completion and mood history"""
+    async def run():
+        await server.storage.ensure_indexes()
+        return await server.rebuild_daily_rollups(user_id, batch_size=batch_size)
+    
+    upserts = asyncio.run(run())
+    typer.echo(f"Rebuilt daily rollups ({upserts} upserts)")
+
+@cli.command("rebuild-streaks")
+def rebuild_streaks(
+    user_id: Optional[str] = typer.Option(None, help="Only rebuild this user's streak")
+):
+    """Recompute streak fields on user documents from daily rollups"""
+    async def run():
+        if user_id:
+            user_ids = [user_id]
+        else:
+            user_ids = [u["id"] async for u in server.storage.users.iter_all(server.PROJECTIONS["user_id"])]
+        for uid in user_ids:
+            await server.rebuild_user_streak(uid)
+        return len(user_ids)
+    
+    rebuilt = asyncio.run(run())
+    typer.echo(f"Rebuilt streaks for {rebuilt} users")
+
+@cli.command("repair-counters")
+def repair_counters(
+    user_id: Optional[str] = typer.Option(None, help="Only check this user"),
+    batch_size: int = typer.Option(500, help="Users per batch"),
+    dry_run: bool = typer.Option(False, help="Report drift without writing")
+):
+    """Check denormalized user counters against source collections and fix drift"""
+    result = asyncio.run(server.repair_user_counters(user_id, batch_size=batch_size, dry_run=dry_run))
+    action = "would repair" if dry_run else "repaired"
+    typer.echo(f"Checked {result['users_checked']} users, {action} {result['users_repaired']}")
+
+@cli.command("import-ndjson")
+def import_ndjson(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="NDJSON file to import"),
+    user_id: str = typer.Option(..., help="User the history is attached to")
+):
+    """Import NDJSON history into a user and rebuild rollups, counters and streaks"""
+    async def lines():
+        with path.open("rb") as f:
+            for line in f:
+                yield line
+    
+    async def run():
+        user = await server.storage.users.get(user_id, server.PROJECTIONS["user_id"])
+        if not user:
+            raise typer.BadParameter(f"user {user_id} not found", param_hint="--user-id")
+        await server.storage.ensure_indexes()
+        return await server.import_user_ndjson(user_id, lines())
+    
+    typer.echo(json.dumps(asyncio.run(run()), indent=2))
+
+if __name__ == "__main__":
+    cli()
@@ -1,24 +1,627 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field, AfterValidator
+from typing import List, Optional, Dict, Any, Callable, AsyncIterator, Awaitable, Annotated
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import functools
 import os
+import time
 import uuid
 import json
-from openai import OpenAI
+import hashlib
+import base64
+import re
+import orjson
+from openai import AsyncOpenAI
 import logging
-from bson import ObjectId
+
+from storage import DuplicateRecordError, create_storage, day_key, project, to_utc_naive
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OpenAI client
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")  # point at a local fake server in tests
+AI_TIMEOUT_SECONDS = float(os.environ.get("AI_TIMEOUT_SECONDS", "8"))
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "8"))
+if not OPENAI_API_KEY:
+    logger.error("OPENAI_API_KEY not found in environment variables")
+    openai_client = None
+else:
+    openai_client = AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=AI_TIMEOUT_SECONDS,
+        max_retries=0
+    )
+
+# Bounds the number of LLM calls in flight across all requests
+ai_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+# AI coaching message cache
+AI_CACHE_TTL_SECONDS = float(os.environ.get("AI_CACHE_TTL_SECONDS", "1800"))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get("AI_CACHE_MAX_ENTRIES", "10000"))
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a fixed TTL"""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def peek(self, key, default=None):
+        """Return an unexpired value without touching LRU order or stats"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return default
+        return entry[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight task"""
+    
+    def __init__(self):
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+    
+    async def do(self, key, func, *args):
+        """Await func(*args), sharing the result with concurrent callers of the same key"""
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(func(*args))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.coalesced += 1
+        
+        # Shield so one caller disconnecting does not cancel the shared call
+        return await asyncio.shield(future)
+    
+    def _forget(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced
+        }
+
+ai_message_cache = TTLCache(AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS)
+COACH_PLACEHOLDER_MESSAGE = "Your AI coach is reviewing your progress... check back in a moment! ✨"
+AI_FALLBACK_MESSAGE = "You're doing amazing! Every small step counts toward your bigger goals! 🚀"
+ai_singleflight = SingleFlight()
+
+# Document cache for users and their active habits. Writes in this process
+# invalidate entries; the TTL bounds staleness from writes made elsewhere.
+DOCUMENT_CACHE_TTL_SECONDS = float(os.environ.get("DOCUMENT_CACHE_TTL_SECONDS", "30"))
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.environ.get("DOCUMENT_CACHE_MAX_ENTRIES", "10000"))
+
+# Per-request memo, installed by RequestMemoMiddleware
+request_memo: ContextVar[Optional[Dict[Any, Any]]] = ContextVar("request_memo", default=None)
+
+class DocumentCache:
+    """Read-through cache: request memo first, then a shared TTLCache, then the loader.
+    
+    Cached values are shared; callers must copy before handing them out.
+    A load that overlaps an invalidation of its key is returned to the
+    caller but not cached, so it cannot put a pre-write document back.
+    """
+    
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.cache = TTLCache(max_entries, ttl_seconds)
+        self.memo_hits = 0
+        self.stale_loads = 0
+        # Bumped by clear() and, for keys with a load in flight, by invalidate()
+        self.epoch = 0
+        self._generations: Dict[Any, int] = {}
+        self._loading: Counter = Counter()
+    
+    async def get(self, key, load: Callable[[], Awaitable[Any]]):
+        memo = request_memo.get()
+        memo_key = (self.name, key)
+        if memo is not None and memo_key in memo:
+            self.memo_hits += 1
+            return memo[memo_key]
+        
+        value = self.cache.get(key)
+        if value is not None:
+            if memo is not None:
+                memo[memo_key] = value
+            return value
+        
+        started = (self.epoch, self._generations.get(key, 0))
+        self._loading[key] += 1
+        try:
+            value = await load()
+        finally:
+            current = (self.epoch, self._generations.get(key, 0))
+            self._loading[key] -= 1
+            if not self._loading[key]:
+                del self._loading[key]
+                self._generations.pop(key, None)
+        if value is None:
+            return None
+        if current != started:
+            self.stale_loads += 1
+            return value
+        self.cache.set(key, value)
+        if memo is not None:
+            memo[memo_key] = value
+        return value
+    
+    def peek(self, key):
+        return self.cache.peek(key)
+    
+    def invalidate(self, key):
+        self.cache.invalidate(key)
+        if key in self._loading:
+            self._generations[key] = self._generations.get(key, 0) + 1
+        memo = request_memo.get()
+        if memo is not None:
+            memo.pop((self.name, key), None)
+    
+    def clear(self):
+        self.cache.clear()
+        self.epoch += 1
+        memo = request_memo.get()
+        if memo is not None:
+            for memo_key in [k for k in memo if k[0] == self.name]:
+                del memo[memo_key]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "memo_hits": self.memo_hits, "stale_loads": self.stale_loads}
+
+user_cache = DocumentCache("users", DOCUMENT_CACHE_MAX_ENTRIES, DOCUMENT_CACHE_TTL_SECONDS)
+active_habits_cache = DocumentCache("active_habits", DOCUMENT_CACHE_MAX_ENTRIES, DOCUMENT_CACHE_TTL_SECONDS)
+# User version each process-local habits entry was last checked against
+habits_checked_versions = TTLCache(DOCUMENT_CACHE_MAX_ENTRIES, DOCUMENT_CACHE_TTL_SECONDS)
+
+class RequestMemoMiddleware:
+    """Gives each HTTP request (and its background tasks) a fresh read memo"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_memo.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_memo.reset(token)
+
+# Live update events, streamed to clients over SSE
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "32"))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+
+class EventHub:
+    """In-process pub/sub keyed by user id.
+    
+    Each subscriber owns a bounded queue; when a slow client's queue is full
+    the oldest event is dropped, so publishing never blocks a write path.
+    Events are encoded once per publish and shared by all subscribers.
+    """
+    
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, set] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+    
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+    
+    def publish(self, user_id: str, event: str, data: Dict[str, Any]) -> int:
+        """Queue an event for every subscriber of user_id; returns how many were reached"""
+        self.published += 1
+        queues = self._subscribers.get(user_id)
+        if not queues:
+            return 0
+        
+        payload = b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(payload)
+        self.delivered += len(queues)
+        return len(queues)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "queue_size": self.queue_size,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped
+        }
+
+event_hub = EventHub(EVENT_QUEUE_SIZE)
+
+# Request instrumentation: per-request phase timings and the queries issued,
+# aggregated per route and served in Prometheus text format at /api/metrics
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))  # 0 disables the slow log
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 4, 5, 8, 13, 21)
+PHASES = ("db", "ai", "serialize")
+
+class RequestMetrics:
+    """Timings collected while one request is handled.
+    
+    Phase times are summed across concurrent calls, so db time can exceed
+    wall time for routes that gather queries.
+    """
+    __slots__ = ("phases", "queries")
+    
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries: List[List[Any]] = []  # [label, seconds]
+
+request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+def record_phase(phase: str, seconds: float):
+    metrics = request_metrics.get()
+    if metrics is not None:
+        metrics.phases[phase] += seconds
+
+def record_query(label: str, seconds: float) -> Optional[List[Any]]:
+    metrics = request_metrics.get()
+    if metrics is None:
+        return None
+    metrics.phases["db"] += seconds
+    entry = [label, seconds]
+    metrics.queries.append(entry)
+    return entry
+
+def timed_phase(phase: str):
+    """Decorator recording an async helper's duration under a request phase"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_phase(phase, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+class InstrumentedCursor:
+    """Motor cursor proxy that times to_list and async iteration as one query"""
+    
+    def __init__(self, cursor, label: str):
+        self._cursor = cursor
+        self._label = label
+        self._entry = None
+    
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+        
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return chained
+    
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.to_list(length)
+        finally:
+            record_query(self._label, time.perf_counter() - started)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.__anext__()
+        finally:
+            elapsed = time.perf_counter() - started
+            if self._entry is None:
+                self._entry = record_query(self._label, elapsed)
+            else:
+                self._entry[1] += elapsed
+                record_phase("db", elapsed)
+
+class InstrumentedCollection:
+    """Motor collection proxy that records every round trip against the current request"""
+    
+    CURSOR_METHODS = {"find", "aggregate", "list_indexes"}
+    ASYNC_METHODS = {
+        "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+        "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+        "delete_one", "delete_many", "bulk_write", "count_documents", "distinct",
+        "create_indexes", "drop"
+    }
+    
+    def __init__(self, collection):
+        self._collection = collection
+    
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        label = f"{self._collection.name}.{name}"
+        if name in self.CURSOR_METHODS:
+            return lambda *args, **kwargs: InstrumentedCursor(attr(*args, **kwargs), label)
+        if name not in self.ASYNC_METHODS:
+            return attr
+        
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                record_query(label, time.perf_counter() - started)
+        return timed
+
+class InstrumentedDatabase:
+    """Motor database proxy handing out InstrumentedCollections"""
+    
+    def __init__(self, database):
+        self._database = database
+        self._collections: Dict[str, InstrumentedCollection] = {}
+    
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            return getattr(self._database, name)
+        return self[name]
+    
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = InstrumentedCollection(self._database[name])
+        return collection
+
+class InstrumentedJSONResponse(ORJSONResponse):
+    """ORJSONResponse that records rendering time as the serialize phase"""
+    
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            record_phase("serialize", time.perf_counter() - started)
+
+class MetricsRegistry:
+    """Per-route latency histograms, phase totals and query counts.
+    
+    Listeners are called with (method, route, metrics) for every observed
+    request; the benchmarks and query-budget tests use them to read the
+    per-request query log.
+    """
+    
+    def __init__(self):
+        self._routes: Dict[tuple, Dict[str, Any]] = {}
+        self._statuses: Counter = Counter()
+        self.listeners: List[Callable[[str, str, RequestMetrics], None]] = []
+    
+    def observe(self, method: str, route: str, status: int, seconds: float, metrics: RequestMetrics):
+        key = (method, route)
+        series = self._routes.get(key)
+        if series is None:
+            series = self._routes[key] = {
+                "latency": [0] * len(LATENCY_BUCKETS),
+                "latency_sum": 0.0,
+                "queries": [0] * len(QUERY_COUNT_BUCKETS),
+                "queries_sum": 0,
+                "count": 0,
+                "phases": dict.fromkeys(PHASES, 0.0)
+            }
+        series["count"] += 1
+        series["latency_sum"] += seconds
+        series["queries_sum"] += len(metrics.queries)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                series["latency"][i] += 1
+        for i, bound in enumerate(QUERY_COUNT_BUCKETS):
+            if len(metrics.queries) <= bound:
+                series["queries"][i] += 1
+        for phase, phase_seconds in metrics.phases.items():
+            series["phases"][phase] += phase_seconds
+        self._statuses[(method, route, status)] += 1
+        for listener in self.listeners:
+            listener(method, route, metrics)
+    
+    def render(self) -> str:
+        lines = [
+            "# HELP habitverse_requests_total Requests handled, by route and status",
+            "# TYPE habitverse_requests_total counter"
+        ]
+        for (method, route, status), count in sorted(self._statuses.items()):
+            lines.append(f'habitverse_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        
+        lines += [
+            "# HELP habitverse_request_duration_seconds Time to send the full response",
+            "# TYPE habitverse_request_duration_seconds histogram"
+        ]
+        for (method, route), series in sorted(self._routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(LATENCY_BUCKETS, series["latency"]):
+                lines.append(f'habitverse_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'habitverse_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'habitverse_request_duration_seconds_sum{{{labels}}} {series["latency_sum"]}')
+            lines.append(f'habitverse_request_duration_seconds_count{{{labels}}} {series["count"]}')
+        
+        lines += [
+            "# HELP habitverse_request_phase_seconds_total Time spent per phase (db, ai, serialize)",
+            "# TYPE habitverse_request_phase_seconds_total counter"
+        ]
+        for (method, route), series in sorted(self._routes.items()):
+            for phase, seconds in series["phases"].items():
+                lines.append(
+                    f'habitverse_request_phase_seconds_total{{method="{method}",route="{route}",phase="{phase}"}} {seconds}'
+                )
+        
+        lines += [
+            "# HELP habitverse_request_db_queries Database round trips per request",
+            "# TYPE habitverse_request_db_queries histogram"
+        ]
+        for (method, route), series in sorted(self._routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(QUERY_COUNT_BUCKETS, series["queries"]):
+                lines.append(f'habitverse_request_db_queries_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'habitverse_request_db_queries_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'habitverse_request_db_queries_sum{{{labels}}} {series["queries_sum"]}')
+            lines.append(f'habitverse_request_db_queries_count{{{labels}}} {series["count"]}')
+        
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
+
+class MetricsMiddleware:
+    """Times each request until its last body chunk is sent and records it per route.
+    
+    Work done afterwards (background tasks) is not attributed to the request.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}
+    
+    def route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if not self._route_paths:
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        metrics = RequestMetrics()
+        token = request_metrics.set(metrics)
+        started = time.perf_counter()
+        status = 500
+        finished = False
+        
+        def finish():
+            nonlocal finished
+            finished = True
+            elapsed = time.perf_counter() - started
+            route = self.route_path(scope)
+            metrics_registry.observe(scope["method"], route, status, elapsed, metrics)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']} ({route}) {elapsed * 1000:.1f} ms: "
+                    + ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in metrics.phases.items())
+                    + f"; {len(metrics.queries)} queries: "
+                    + ", ".join(f"{label} {seconds * 1000:.1f} ms" for label, seconds in metrics.queries)
+                )
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finish()
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not finished:
+                finish()
+            request_metrics.reset(token)
+
+# Storage engine (STORAGE_ENGINE=mongo|memory); Mongo handles are instrumented per request
+storage = create_storage(wrap_database=InstrumentedDatabase)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build indexes in the background so startup is not blocked on large collections
+    index_task = asyncio.create_task(storage.ensure_indexes())
+    yield
+    if not index_task.done():
+        index_task.cancel()
+    storage.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="HabitVerse API", version="1.0.0")
+app = FastAPI(
+    title="HabitVerse API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=InstrumentedJSONResponse
+)
 
 # CORS configuration
 app.add_middleware(
@@ -27,25 +630,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
-
-# MongoDB connection
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DB_NAME = os.environ.get("DB_NAME", "habitverse")
-
-# OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    logger.error("OPENAI_API_KEY not found in environment variables")
-    openai_client = None
-else:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-# MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+app.add_middleware(RequestMemoMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Pydantic models
+# Client-supplied timestamps may carry any offset; store and bucket them in UTC
+UTCDateTime = Annotated[datetime, AfterValidator(to_utc_naive)]
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -54,6 +647,7 @@ class User(BaseModel):
     total_xp: int = 0
     current_streak: int = 0
     longest_streak: int = 0
+    last_active_date: Optional[str] = None  # YYYY-MM-DD of the latest completion
     world_type: str = "forest"  # forest, city, fantasy
     avatar_customization: Dict[str, Any] = Field(default_factory=lambda: {
         "color": "#90EE90",
@@ -61,7 +655,14 @@ class User(BaseModel):
         "background": "forest"
     })
     achievements: List[str] = Field(default_factory=list)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Denormalized counters read by the achievement engine
+    active_habits_count: int = 0
+    completions_count: int = 0
+    mood_entries_count: int = 0
+    category_completions: Dict[str, int] = Field(default_factory=dict)
+    # Bumped by every write that can change what read routes return (see user_etag)
+    version: int = 0
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
 
 class Habit(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -73,7 +674,7 @@ class Habit(BaseModel):
     xp_reward: int = 10
     is_active: bool = True
     target_frequency: str = "daily"  # daily, weekly
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
 
 class HabitCompletionRequest(BaseModel):
     user_id: str
@@ -82,11 +683,22 @@ class HabitCompletionRequest(BaseModel):
     energy_level: Optional[int] = 4
     notes: Optional[str] = None
 
+class BatchCompletionItem(BaseModel):
+    habit_id: str
+    mood_rating: Optional[int] = 4
+    energy_level: Optional[int] = 4
+    notes: Optional[str] = None
+
+class BatchCompletionRequest(BaseModel):
+    user_id: str
+    items: List[BatchCompletionItem] = Field(..., min_length=1, max_length=100)
+
 class HabitCompletion(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     habit_id: str
-    completed_at: datetime = Field(default_factory=datetime.utcnow)
+    completed_at: UTCDateTime = Field(default_factory=datetime.utcnow)
+    completed_on: str  # YYYY-MM-DD of completed_at; part of the once-per-day unique key
     xp_earned: int
     mood_rating: Optional[int] = None  # 1-5 scale
     energy_level: Optional[int] = None  # 1-5 scale
@@ -98,7 +710,7 @@ class MoodEntry(BaseModel):
     mood_rating: int  # 1-5 scale
     energy_level: int  # 1-5 scale
     notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
 
 class Achievement(BaseModel):
     id: str
@@ -112,31 +724,62 @@ class AIMessage(BaseModel):
     message: str
     message_type: str  # encouragement, suggestion, coaching, quest
 
-# Helper functions
-def serialize_doc(doc):
-    """Convert MongoDB document to JSON serializable format"""
-    if doc is None:
-        return None
-    if isinstance(doc, list):
-        return [serialize_doc(item) for item in doc]
-    if isinstance(doc, dict):
-        result = {}
-        for key, value in doc.items():
-            if key == '_id':
-                continue  # Skip MongoDB's _id field
-            if isinstance(value, ObjectId):
-                result[key] = str(value)
-            elif isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, dict):
-                result[key] = serialize_doc(value)
-            elif isinstance(value, list):
-                result[key] = serialize_doc(value)
-            else:
-                result[key] = value
-        return result
-    return doc
+# Field projections per use case. Every read names the one it needs so wire
+# bytes and decoding scale with what the endpoint actually uses.
+USER_PROFILE_FIELDS = {
+    "_id": 0, "id": 1, "username": 1, "email": 1, "avatar_level": 1, "total_xp": 1,
+    "current_streak": 1, "longest_streak": 1, "last_active_date": 1, "world_type": 1,
+    "avatar_customization": 1, "achievements": 1, "created_at": 1
+}
 
+PROJECTIONS: Dict[str, Dict[str, int]] = {
+    # users
+    "user_profile": USER_PROFILE_FIELDS,
+    "user_dashboard": {**USER_PROFILE_FIELDS, "coach_message": 1},
+    "user_stats": {
+        "_id": 0, "total_xp": 1, "active_habits_count": 1, "completions_count": 1,
+        "mood_entries_count": 1, "category_completions": 1
+    },
+    "user_streak": {"_id": 0, "current_streak": 1, "longest_streak": 1, "last_active_date": 1},
+    "user_achievements": {"_id": 0, "achievements": 1},
+    "user_achievement_counters": {
+        "_id": 0, "achievements": 1, "total_xp": 1, "current_streak": 1, "last_active_date": 1,
+        "active_habits_count": 1, "completions_count": 1, "mood_entries_count": 1
+    },
+    "user_coach_message": {"_id": 0, "coach_message": 1},
+    "user_counters": {
+        "_id": 0, "id": 1, "active_habits_count": 1, "completions_count": 1,
+        "mood_entries_count": 1, "category_completions": 1
+    },
+    "user_id": {"_id": 0, "id": 1},
+    "user_version": {"_id": 0, "version": 1},
+    # What user_cache holds: the fields the hot read paths share
+    "user_cached": {**USER_PROFILE_FIELDS, "coach_message": 1, "version": 1},
+    # habits
+    "habit_card": {
+        "_id": 0, "id": 1, "user_id": 1, "name": 1, "description": 1, "category": 1,
+        "difficulty": 1, "xp_reward": 1, "target_frequency": 1, "created_at": 1
+    },
+    "habit_reward": {"_id": 0, "xp_reward": 1, "category": 1},
+    "habit_reward_by_id": {"_id": 0, "id": 1, "xp_reward": 1, "category": 1},
+    "habit_name_category": {"_id": 0, "name": 1, "category": 1},
+    "habit_counters": {"_id": 0, "id": 1, "user_id": 1, "category": 1, "is_active": 1},
+    # habit_completions
+    "completion_history": {
+        "_id": 0, "id": 1, "habit_id": 1, "completed_at": 1, "xp_earned": 1,
+        "mood_rating": 1, "energy_level": 1, "notes": 1
+    },
+    # mood_entries
+    "mood_history": {"_id": 0, "id": 1, "mood_rating": 1, "energy_level": 1, "notes": 1, "created_at": 1},
+    "mood_recent": {"_id": 0, "id": 1, "user_id": 1, "mood_rating": 1, "energy_level": 1, "notes": 1, "created_at": 1},
+    "mood_trend": {"_id": 0, "mood_rating": 1, "energy_level": 1},
+    # full documents, for data export
+    "export": {"_id": 0},
+}
+
+# Helper functions
+# Documents are read with {"_id": 0} and returned as-is: ORJSONResponse
+# encodes datetimes natively, so no per-document conversion pass is needed.
 def calculate_level(xp: int) -> int:
     """Calculate user level based on XP"""
     return min(50, max(1, int((xp / 100) ** 0.5) + 1))
@@ -161,169 +804,269 @@ def get_avatar_evolution(level: int) -> Dict[str, Any]:
     
     return current_stage
 
+# Achievement definitions, built once at import
+ACHIEVEMENTS: List[Achievement] = [
+    Achievement(
+        id="first_habit",
+        name="Baby Steps",
+        description="Complete your first habit",
+        icon="👶",
+        requirement={"type": "habit_completions", "count": 1},
+        reward_xp=50
+    ),
+    Achievement(
+        id="week_warrior",
+        name="Week Warrior",
+        description="Maintain a 7-day streak",
+        icon="⚔️",
+        requirement={"type": "streak", "count": 7},
+        reward_xp=100
+    ),
+    Achievement(
+        id="habit_collector",
+        name="Habit Collector",
+        description="Create 5 different habits",
+        icon="📋",
+        requirement={"type": "habit_count", "count": 5},
+        reward_xp=75
+    ),
+    Achievement(
+        id="xp_master",
+        name="XP Master",
+        description="Earn 500 total XP",
+        icon="⭐",
+        requirement={"type": "total_xp", "count": 500},
+        reward_xp=100
+    ),
+    Achievement(
+        id="consistency_king",
+        name="Consistency King",
+        description="Complete 30 habits total",
+        icon="👑",
+        requirement={"type": "habit_completions", "count": 30},
+        reward_xp=200
+    ),
+    Achievement(
+        id="mood_tracker",
+        name="Mood Tracker",
+        description="Log your mood 10 times",
+        icon="😊",
+        requirement={"type": "mood_entries", "count": 10},
+        reward_xp=50
+    ),
+    Achievement(
+        id="level_up",
+        name="Level Up Legend",
+        description="Reach level 10",
+        icon="🚀",
+        requirement={"type": "level", "count": 10},
+        reward_xp=150
+    )
+]
+
+# How to read each requirement type's current value off a user document
+COUNTER_READERS: Dict[str, Callable[[Dict], int]] = {
+    "habit_completions": lambda user: user.get("completions_count", 0),
+    "streak": lambda user: effective_streak(user),
+    "habit_count": lambda user: user.get("active_habits_count", 0),
+    "total_xp": lambda user: user.get("total_xp", 0),
+    "mood_entries": lambda user: user.get("mood_entries_count", 0),
+    "level": lambda user: calculate_level(user.get("total_xp", 0)),
+}
+
+# Requirement types each event can move
+EVENT_COUNTERS: Dict[str, List[str]] = {
+    "habit_completed": ["habit_completions", "streak", "total_xp", "level"],
+    "mood_logged": ["mood_entries"],
+    "habit_created": ["habit_count"],
+    "xp_gained": ["total_xp", "level"],
+    "history_imported": ["habit_completions", "streak", "habit_count", "total_xp", "mood_entries", "level"],
+}
+
+def build_rule_index(achievements: List[Achievement]) -> Dict[str, List[Achievement]]:
+    """Index achievements by the events whose counters they depend on"""
+    by_counter: Dict[str, List[Achievement]] = {}
+    for achievement in achievements:
+        by_counter.setdefault(achievement.requirement["type"], []).append(achievement)
+    return {
+        event: [a for counter in counters for a in by_counter.get(counter, [])]
+        for event, counters in EVENT_COUNTERS.items()
+    }
+
+RULES_BY_EVENT = build_rule_index(ACHIEVEMENTS)
+
 def get_available_achievements() -> List[Achievement]:
     """Get all available achievements"""
-    return [
-        Achievement(
-            id="first_habit",
-            name="Baby Steps",
-            description="Complete your first habit",
-            icon="👶",
-            requirement={"type": "habit_completions", "count": 1},
-            reward_xp=50
-        ),
-        Achievement(
-            id="week_warrior",
-            name="Week Warrior",
-            description="Maintain a 7-day streak",
-            icon="⚔️",
-            requirement={"type": "streak", "count": 7},
-            reward_xp=100
-        ),
-        Achievement(
-            id="habit_collector",
-            name="Habit Collector",
-            description="Create 5 different habits",
-            icon="📋",
-            requirement={"type": "habit_count", "count": 5},
-            reward_xp=75
-        ),
-        Achievement(
-            id="xp_master",
-            name="XP Master",
-            description="Earn 500 total XP",
-            icon="⭐",
-            requirement={"type": "total_xp", "count": 500},
-            reward_xp=100
-        ),
-        Achievement(
-            id="consistency_king",
-            name="Consistency King",
-            description="Complete 30 habits total",
-            icon="👑",
-            requirement={"type": "habit_completions", "count": 30},
-            reward_xp=200
-        ),
-        Achievement(
-            id="mood_tracker",
-            name="Mood Tracker",
-            description="Log your mood 10 times",
-            icon="😊",
-            requirement={"type": "mood_entries", "count": 10},
-            reward_xp=50
-        ),
-        Achievement(
-            id="level_up",
-            name="Level Up Legend",
-            description="Reach level 10",
-            icon="🚀",
-            requirement={"type": "level", "count": 10},
-            reward_xp=150
-        )
-    ]
+    return ACHIEVEMENTS
 
-async def check_achievements(user_id: str):
-    """Check and award new achievements for user"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        return []
+async def evaluate_achievements(user_id: str, user: Dict, event: str) -> List[Achievement]:
+    """Award achievements unlocked by an event.
     
-    user = serialize_doc(user)
-    current_achievements = user.get("achievements", [])
-    available_achievements = get_available_achievements()
+    Only rules subscribed to the event are checked, against counters on the
+    given (post-update) user document, so no counting queries are issued.
+    XP bonuses can cascade into the XP/level rules before the single award write.
+    """
+    unlocked = set(user.get("achievements", []))
+    projected = dict(user)
     new_achievements = []
     
-    # Get user stats
-    habits_count = await db.habits.count_documents({"user_id": user_id, "is_active": True})
-    completions_count = await db.habit_completions.count_documents({"user_id": user_id})
-    mood_entries_count = await db.mood_entries.count_documents({"user_id": user_id})
-    current_level = calculate_level(user["total_xp"])
-    
-    for achievement in available_achievements:
-        if achievement.id in current_achievements:
-            continue
-            
-        req = achievement.requirement
-        earned = False
-        
-        if req["type"] == "habit_completions" and completions_count >= req["count"]:
-            earned = True
-        elif req["type"] == "streak" and user["current_streak"] >= req["count"]:
-            earned = True
-        elif req["type"] == "habit_count" and habits_count >= req["count"]:
-            earned = True
-        elif req["type"] == "total_xp" and user["total_xp"] >= req["count"]:
-            earned = True
-        elif req["type"] == "mood_entries" and mood_entries_count >= req["count"]:
-            earned = True
-        elif req["type"] == "level" and current_level >= req["count"]:
-            earned = True
+    candidates = RULES_BY_EVENT[event]
+    while candidates:
+        earned = [
+            a for a in candidates
+            if a.id not in unlocked
+            and COUNTER_READERS[a.requirement["type"]](projected) >= a.requirement["count"]
+        ]
+        if not earned:
+            break
         
-        if earned:
-            new_achievements.append(achievement)
-            current_achievements.append(achievement.id)
-            
-            # Award XP bonus
-            if achievement.reward_xp > 0:
-                await db.users.update_one(
-                    {"id": user_id},
-                    {"$inc": {"total_xp": achievement.reward_xp}}
-                )
+        new_achievements.extend(earned)
+        unlocked.update(a.id for a in earned)
+        bonus = sum(a.reward_xp for a in earned)
+        if not bonus:
+            break
+        projected["total_xp"] = projected.get("total_xp", 0) + bonus
+        candidates = RULES_BY_EVENT["xp_gained"]
     
-    # Update user achievements
+    # Award achievements and their XP bonus in one update, guarded per id so a
+    # concurrent request that got some of them first only costs us those
     if new_achievements:
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"achievements": current_achievements}}
+        awarded = await storage.users.award_achievements(
+            user_id, {a.id: a.reward_xp for a in new_achievements}
         )
+        invalidate_user_cache(user_id)
+        new_achievements = [a for a in new_achievements if a.id in awarded]
+        if not new_achievements:
+            return []
+        event_hub.publish(user_id, "achievements", {
+            "achievements": [{"id": a.id, "name": a.name, "description": a.description, "icon": a.icon} for a in new_achievements],
+            "xp_bonus": sum(a.reward_xp for a in new_achievements)
+        })
     
     return new_achievements
 
+async def ai_chat_completion(prompt: str, max_tokens: int, temperature: float) -> Optional[str]:
+    """Run a single chat completion without blocking the event loop.
+    
+    Returns None when the client is unavailable, every slot is busy, the call
+    exceeds AI_TIMEOUT_SECONDS or the API errors, so callers can fall back to
+    a canned message straight away.
+    """
+    if not openai_client:
+        return None
+    
+    # Fail fast instead of queueing behind slow calls; acquire() does not
+    # suspend when a slot is free, so check-then-acquire is race free here
+    if ai_semaphore.locked():
+        logger.warning("AI concurrency limit reached, using fallback")
+        return None
+    await ai_semaphore.acquire()
+    
+    try:
+        response = await asyncio.wait_for(
+            openai_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            timeout=AI_TIMEOUT_SECONDS
+        )
+        return response.choices[0].message.content.strip()
+    except asyncio.TimeoutError:
+        logger.warning(f"AI call exceeded {AI_TIMEOUT_SECONDS}s budget, using fallback")
+    except Exception as e:
+        logger.error(f"AI completion error: {e}")
+    finally:
+        ai_semaphore.release()
+    return None
+
+def get_coaching_inputs(user_data: Dict, habit_data: List[Dict], mood_data: List[Dict]) -> Dict[str, Any]:
+    """Extract the only inputs the AI coaching prompt depends on"""
+    return {
+        "level": calculate_level(user_data.get('total_xp', 0)),
+        "total_xp": user_data.get('total_xp', 0),
+        "current_streak": user_data.get('current_streak', 0),
+        "habit_count": len(habit_data),
+        "achievement_count": len(user_data.get('achievements', [])),
+        "recent_habits": [h.get('name', '') for h in habit_data[:3]],
+        "recent_mood": mood_data[0].get('mood_rating', 3) if mood_data else 3
+    }
+
+def coaching_fingerprint(inputs: Dict[str, Any]) -> str:
+    """Stable cache key for a set of coaching inputs"""
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+@timed_phase("ai")
 async def get_ai_suggestion(user_data: Dict, habit_data: List[Dict], mood_data: List[Dict]) -> str:
     """Get AI-powered habit suggestions and coaching"""
     if not openai_client:
         return "Keep up the great work! Your consistency is building a stronger you every day! 🌟"
     
     try:
-        # Prepare context for AI
-        context = f"""
-        User Profile:
-        - Level: {calculate_level(user_data.get('total_xp', 0))}
-        - Total XP: {user_data.get('total_xp', 0)}
-        - Current Streak: {user_data.get('current_streak', 0)}
-        - Habits: {len(habit_data)} active habits
-        - Achievements: {len(user_data.get('achievements', []))}
-        
-        Recent Habits: {', '.join([h.get('name', '') for h in habit_data[:3]])}
-        
-        Recent Mood: {mood_data[0].get('mood_rating', 3) if mood_data else 3}/5
-        """
-        
-        prompt = f"""You are a supportive AI coach for HabitVerse, a gamified habit-building app. 
-        
-        User Context: {context}
+        inputs = get_coaching_inputs(user_data, habit_data, mood_data)
+        fingerprint = coaching_fingerprint(inputs)
+        cached = ai_message_cache.get(fingerprint)
+        if cached:
+            return cached
         
-        Provide a personalized, encouraging message (max 2 sentences) that:
-        1. Acknowledges their progress
-        2. Offers gentle motivation or a specific tip
-        3. Uses gamification language (XP, level up, quest, etc.)
-        4. Keeps it positive and engaging
-        
-        Make it feel like a friendly companion, not a formal coach."""
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=100,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content.strip()
+        message = await ai_singleflight.do(("coaching", fingerprint), _request_coaching_message, inputs, fingerprint)
+        if message:
+            return message
     
     except Exception as e:
         logger.error(f"AI suggestion error: {e}")
-        return "You're doing amazing! Every small step counts toward your bigger goals! 🚀"
+    
+    return AI_FALLBACK_MESSAGE
 
+async def _request_coaching_message(inputs: Dict[str, Any], fingerprint: str) -> Optional[str]:
+    """Ask the model for a coaching message and cache it under the fingerprint"""
+    # Prepare context for AI
+    context = f"""
+    User Profile:
+    - Level: {inputs['level']}
+    - Total XP: {inputs['total_xp']}
+    - Current Streak: {inputs['current_streak']}
+    - Habits: {inputs['habit_count']} active habits
+    - Achievements: {inputs['achievement_count']}
+    
+    Recent Habits: {', '.join(inputs['recent_habits'])}
+    
+    Recent Mood: {inputs['recent_mood']}/5
+    """
+    
+    prompt = f"""You are a supportive AI coach for HabitVerse, a gamified habit-building app. 
+    
+    User Context: {context}
+    
+    Provide a personalized, encouraging message (max 2 sentences) that:
+    1. Acknowledges their progress
+    2. Offers gentle motivation or a specific tip
+    3. Uses gamification language (XP, level up, quest, etc.)
+    4. Keeps it positive and engaging
+    
+    Make it feel like a friendly companion, not a formal coach."""
+    
+    message = await ai_chat_completion(prompt, max_tokens=100, temperature=0.7)
+    if message:
+        # Only real model output is cached; fallbacks should be retried
+        ai_message_cache.set(fingerprint, message)
+    return message
+
+async def refresh_coach_message(user_id: str, inputs: Dict[str, Any], fingerprint: str):
+    """Generate a coaching message off the request path and store it on the user"""
+    message = await ai_singleflight.do(("coaching", fingerprint), _request_coaching_message, inputs, fingerprint)
+    if not message:
+        return
+    
+    await storage.users.set_fields(user_id, {"coach_message": {
+        "message": message,
+        "token": fingerprint,
+        "generated_at": datetime.utcnow()
+    }})
+    invalidate_user_cache(user_id)
+
+@timed_phase("ai")
 async def generate_habit_suggestions(user_interests: List[str], current_habits: List[str]) -> List[Dict]:
     """Generate AI-powered habit suggestions"""
     if not openai_client:
@@ -333,59 +1076,403 @@ async def generate_habit_suggestions(user_interests: List[str], current_habits:
             {"name": "Gratitude Journal", "description": "Write down 3 things you're grateful for", "category": "wellness"}
         ]
     
-    try:
-        prompt = f"""Generate 3 personalized habit suggestions for a user with these interests: {', '.join(user_interests)}
-        
-        They already have these habits: {', '.join(current_habits)}
-        
-        Return ONLY a JSON array with this format:
-        [
-            {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}},
-            {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}},
-            {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}}
-        ]
-        
-        Make habits specific, achievable, and different from existing ones."""
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300,
-            temperature=0.8
-        )
+    try:
+        key = ("suggestions", tuple(sorted(user_interests)), tuple(sorted(current_habits)))
+        suggestions = await ai_singleflight.do(key, _request_habit_suggestions, user_interests, current_habits)
+        if suggestions:
+            return suggestions
+    
+    except Exception as e:
+        logger.error(f"Habit suggestion error: {e}")
+    
+    return [
+        {"name": "Power Walk", "description": "Take a brisk 10-minute walk", "category": "fitness"},
+        {"name": "Digital Detox", "description": "30 minutes without screens", "category": "wellness"},
+        {"name": "Learning Sprint", "description": "Read for 15 minutes", "category": "productivity"}
+    ]
+
+async def _request_habit_suggestions(user_interests: List[str], current_habits: List[str]) -> Optional[List[Dict]]:
+    """Ask the model for habit suggestions and parse its JSON reply"""
+    prompt = f"""Generate 3 personalized habit suggestions for a user with these interests: {', '.join(user_interests)}
+    
+    They already have these habits: {', '.join(current_habits)}
+    
+    Return ONLY a JSON array with this format:
+    [
+        {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}},
+        {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}},
+        {{"name": "Habit Name", "description": "Brief description", "category": "fitness|focus|sleep|wellness|productivity"}}
+    ]
+    
+    Make habits specific, achievable, and different from existing ones."""
+    
+    content = await ai_chat_completion(prompt, max_tokens=300, temperature=0.8)
+    if not content:
+        return None
+    return json.loads(content)
+
+def cache_covers(projection: str) -> bool:
+    """Whether an inclusion projection only names fields held in user_cache"""
+    fields = [field for field, include in PROJECTIONS[projection].items() if include]
+    return bool(fields) and all(field in PROJECTIONS["user_cached"] for field in fields)
+
+async def get_cached_user(user_id: str, projection: str = "user_cached") -> Optional[Dict]:
+    """Read a user, returning a private copy.
+    
+    Projections covered by user_cached are served through the document cache;
+    others (counters, stats) read only their own fields, so a cache miss never
+    widens a narrow read to the whole document.
+    """
+    if not cache_covers(projection):
+        return await storage.users.get(user_id, PROJECTIONS[projection])
+    user = await user_cache.get(
+        user_id, lambda: storage.users.get(user_id, PROJECTIONS["user_cached"])
+    )
+    return project(user, PROJECTIONS[projection]) if user is not None else None
+
+async def get_cached_active_habits(user_id: str, projection: str = "habit_card") -> List[Dict]:
+    """Read a user's active habits through the document cache, returning private copies"""
+    habits = await active_habits_cache.get(
+        user_id,
+        lambda: storage.habits.list_active(user_id, PROJECTIONS["habit_card"])
+    )
+    return [project(habit, PROJECTIONS[projection]) for habit in habits]
+
+def invalidate_user_cache(user_id: Optional[str] = None):
+    """Drop cached user documents after a write; None drops every user"""
+    if user_id is None:
+        user_cache.clear()
+    else:
+        user_cache.invalidate(user_id)
+
+def invalidate_habits_cache(user_id: Optional[str] = None):
+    """Drop cached active habits after a write; None drops every user's"""
+    if user_id is None:
+        active_habits_cache.clear()
+    else:
+        active_habits_cache.invalidate(user_id)
+
+async def get_habits_with_today_status(user_id: str):
+    """Get active habits annotated with today's completion status.
+    
+    Issues at most two queries regardless of habit count (one when the
+    habits are cached). Returns the habits and the total number of
+    completions logged today.
+    """
+    habits = await get_cached_active_habits(user_id)
+    
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_counts = Counter(await storage.completions.habit_ids_since(user_id, today))
+    
+    for habit in habits:
+        habit["completions_today"] = today_counts.get(habit["id"], 0)
+        habit["completed_today"] = habit["completions_today"] > 0
+    
+    return habits, sum(today_counts.values())
+
+async def record_completion_rollup(user_id: str, completed_at: datetime, xp_earned: int, completions: int = 1):
+    """Add completions to the user's daily rollup"""
+    await storage.rollups.add_completions(user_id, day_key(completed_at), completions, xp_earned)
+
+async def record_mood_rollup(user_id: str, created_at: datetime, mood_rating: int, energy_level: int):
+    """Add a mood entry to the user's daily rollup; the latest entry by created_at sets the day's mood"""
+    await storage.rollups.add_mood(user_id, day_key(created_at), created_at, mood_rating, energy_level)
+
+def category_counter_key(category: str) -> str:
+    """Field-name-safe key for a habit category in category_completions"""
+    return re.sub(r"[^a-z0-9_]", "_", category.lower()) or "other"
+
+def effective_streak(user: Dict) -> int:
+    """Current streak as of today; a streak lapses once a full day is missed"""
+    last_active_date = user.get("last_active_date")
+    if last_active_date is None:
+        return user.get("current_streak", 0)
+    
+    yesterday = day_key(datetime.utcnow() - timedelta(days=1))
+    return user.get("current_streak", 0) if last_active_date >= yesterday else 0
+
+async def apply_completions_to_user(user_id: str, day: str, xp_earned: int, category_counts: Dict[str, int]):
+    """Apply recorded completions to the user in one update, then award achievements.
+    
+    Returns the user's post-update counters (None if the user does not exist)
+    and the newly unlocked achievements.
+    """
+    category_keys = Counter()
+    for category, count in category_counts.items():
+        category_keys[category_counter_key(category)] += count
+    user = await storage.users.apply_completions(
+        user_id, day, xp_earned, category_keys, PROJECTIONS["user_achievement_counters"]
+    )
+    invalidate_user_cache(user_id)
+    if not user:
+        return None, []
+    
+    event_hub.publish(user_id, "progress", {
+        "completions": sum(category_counts.values()),
+        "xp_earned": xp_earned,
+        "total_xp": user["total_xp"],
+        "current_level": calculate_level(user["total_xp"]),
+        "level_up": calculate_level(user["total_xp"]) > calculate_level(user["total_xp"] - xp_earned),
+        "current_streak": user["current_streak"]
+    })
+    new_achievements = await evaluate_achievements(user_id, user, "habit_completed")
+    return user, new_achievements
+
+async def rebuild_user_streak(user_id: str):
+    """Recompute streak fields for one user from their daily rollups"""
+    last_active_date = None
+    current_streak = 0
+    longest_streak = 0
+    async for date in storage.rollups.active_dates(user_id):
+        if last_active_date and date == day_key(datetime.strptime(last_active_date, "%Y-%m-%d") + timedelta(days=1)):
+            current_streak += 1
+        else:
+            current_streak = 1
+        longest_streak = max(longest_streak, current_streak)
+        last_active_date = date
+    
+    await storage.users.set_fields(user_id, {
+        "current_streak": current_streak,
+        "longest_streak": longest_streak,
+        "last_active_date": last_active_date
+    })
+    invalidate_user_cache(user_id)
+
+async def repair_user_counters(user_id: Optional[str] = None, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """Recompute denormalized user counters from the source collections.
+    
+    Users are processed in batches of batch_size, with one grouped query per
+    source collection per batch. Only users whose counters drifted are
+    rewritten; with dry_run nothing is written.
+    """
+    checked = 0
+    repaired = 0
+    batch = []
+    
+    async def repair_batch(users: List[Dict]) -> int:
+        user_ids = [u["id"] for u in users]
+        habits = await storage.habits.list_for_users(user_ids, PROJECTIONS["habit_counters"])
+        per_habit = await storage.completions.counts_by_habit(user_ids)
+        per_user_moods = await storage.moods.counts_by_user(user_ids)
+        
+        expected = {
+            uid: {"active_habits_count": 0, "completions_count": 0, "mood_entries_count": 0, "category_completions": {}}
+            for uid in user_ids
+        }
+        habit_categories = {}
+        for habit in habits:
+            habit_categories[habit["id"]] = habit["category"]
+            if habit.get("is_active"):
+                expected[habit["user_id"]]["active_habits_count"] += 1
+        for (uid, habit_id), count in per_habit.items():
+            counters = expected[uid]
+            counters["completions_count"] += count
+            category = habit_categories.get(habit_id)
+            if category:
+                key = category_counter_key(category)
+                counters["category_completions"][key] = counters["category_completions"].get(key, 0) + count
+        for uid, count in per_user_moods.items():
+            expected[uid]["mood_entries_count"] = count
+        
+        updates = {}
+        for user in users:
+            counters = expected[user["id"]]
+            if any(user.get(field, {} if field == "category_completions" else 0) != value for field, value in counters.items()):
+                updates[user["id"]] = counters
+        if updates and not dry_run:
+            await storage.users.set_fields_many(updates)
+            for repaired_id in updates:
+                invalidate_user_cache(repaired_id)
+        return len(updates)
+    
+    async for user in storage.users.iter_all(PROJECTIONS["user_counters"], user_id):
+        batch.append(user)
+        if len(batch) >= batch_size:
+            repaired += await repair_batch(batch)
+            checked += len(batch)
+            batch = []
+    if batch:
+        repaired += await repair_batch(batch)
+        checked += len(batch)
+    
+    return {"users_checked": checked, "users_repaired": repaired}
+
+async def rebuild_daily_rollups(user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Rebuild daily rollups from raw completions and mood entries.
+    
+    Rebuilds one user, or every user when user_id is None. Writes that land
+    while the rebuild runs may be lost, so run it per user or off-peak.
+    Returns the number of rollup upserts issued.
+    """
+    await storage.rollups.delete(user_id)
+    
+    upserts = 0
+    for rows in (storage.completions.daily_totals(user_id), storage.moods.daily_summaries(user_id)):
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await storage.rollups.upsert_many(batch)
+                upserts += len(batch)
+                batch = []
+        if batch:
+            await storage.rollups.upsert_many(batch)
+            upserts += len(batch)
+    
+    # Analytics responses changed, so invalidate their ETags
+    await storage.users.bump_versions(user_id)
+    invalidate_user_cache(user_id)
+    return upserts
+
+# NDJSON export/import: one {"type": ..., "data": ...} record per line
+EXPORT_REPOSITORIES = [
+    ("habit", "habits"),
+    ("completion", "completions"),
+    ("mood", "moods"),
+]
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 20
+
+async def export_user_ndjson(user: Dict) -> AsyncIterator[bytes]:
+    """Stream a user's profile and full history as NDJSON, one document at a time"""
+    yield orjson.dumps({"type": "user", "data": user}) + b"\n"
+    for record_type, repository_name in EXPORT_REPOSITORIES:
+        repository = getattr(storage, repository_name)
+        async for doc in repository.iter_for_user(user["id"], PROJECTIONS["export"], IMPORT_BATCH_SIZE):
+            yield orjson.dumps({"type": record_type, "data": doc}) + b"\n"
+
+def parse_import_record(record_type: str, data: Dict, user_id: str) -> Dict:
+    """Validate one imported record and return the document to insert for user_id"""
+    data = {**data, "user_id": user_id}
+    if record_type == "habit":
+        return Habit(**data).dict()
+    if record_type == "completion":
+        completion = HabitCompletion(**{**data, "completed_on": data.get("completed_on") or ""})
+        if not completion.completed_on:
+            completion.completed_on = day_key(completion.completed_at)
+        return completion.dict()
+    if record_type == "mood":
+        return MoodEntry(**data).dict()
+    raise ValueError(f"unknown record type {record_type!r}")
+
+async def import_user_ndjson(user_id: str, lines: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """Import NDJSON history for a user, then rebuild everything derived from it.
+    
+    Records are inserted in unordered batches; documents whose id
+    (or habit/day) already exists are skipped, so re-running an import is safe.
+    "user" records are ignored: history is always attached to user_id.
+    """
+    repositories = dict(EXPORT_REPOSITORIES)
+    batches: Dict[str, List[Dict]] = {record_type: [] for record_type in repositories}
+    inserted = {record_type: 0 for record_type in repositories}
+    skipped = {record_type: 0 for record_type in repositories}
+    imported_xp = 0
+    invalid_lines = 0
+    errors = []
+    
+    async def flush(record_type: str):
+        nonlocal imported_xp
+        docs = batches[record_type]
+        if not docs:
+            return
+        batches[record_type] = []
+        failed = await getattr(storage, repositories[record_type]).insert_many(docs)
+        inserted[record_type] += len(docs) - len(failed)
+        skipped[record_type] += len(failed)
+        if record_type == "completion":
+            imported_xp += sum(doc["xp_earned"] for i, doc in enumerate(docs) if i not in failed)
+    
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            if record.get("type") == "user":
+                continue
+            doc = parse_import_record(record.get("type"), record.get("data") or {}, user_id)
+        except Exception as e:
+            invalid_lines += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
         
-        suggestions = json.loads(response.choices[0].message.content.strip())
-        return suggestions
+        batches[record["type"]].append(doc)
+        if len(batches[record["type"]]) >= IMPORT_BATCH_SIZE:
+            await flush(record["type"])
     
-    except Exception as e:
-        logger.error(f"Habit suggestion error: {e}")
-        return [
-            {"name": "Power Walk", "description": "Take a brisk 10-minute walk", "category": "fitness"},
-            {"name": "Digital Detox", "description": "30 minutes without screens", "category": "wellness"},
-            {"name": "Learning Sprint", "description": "Read for 15 minutes", "category": "productivity"}
-        ]
+    for record_type in repositories:
+        await flush(record_type)
+    
+    # Rebuild derived state from the merged history
+    await storage.users.increment(user_id, {"total_xp": imported_xp}, PROJECTIONS["user_version"])
+    invalidate_user_cache(user_id)
+    invalidate_habits_cache(user_id)
+    await rebuild_daily_rollups(user_id)
+    await repair_user_counters(user_id)
+    await rebuild_user_streak(user_id)
+    
+    new_achievements = []
+    user = await get_cached_user(user_id, "user_achievement_counters")
+    if user:
+        new_achievements = await evaluate_achievements(user_id, user, "history_imported")
+    
+    return {
+        "inserted": inserted,
+        "skipped_duplicates": skipped,
+        "invalid_lines": invalid_lines,
+        "errors": errors,
+        "new_achievements": [{"name": a.name, "description": a.description, "icon": a.icon} for a in new_achievements]
+    }
+
+async def iter_request_lines(request: Request) -> AsyncIterator[bytes]:
+    """Split a streamed request body into lines without buffering all of it"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
 
-async def get_analytics_data(user_id: str) -> Dict[str, Any]:
-    """Get comprehensive analytics data for user"""
-    # Get completions from last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    completions_cursor = db.habit_completions.find({
-        "user_id": user_id,
-        "completed_at": {"$gte": thirty_days_ago}
-    }).sort("completed_at", 1)
+def encode_page_cursor(moment: datetime, doc_id: str) -> str:
+    """Opaque cursor pointing just past (moment, doc_id) in newest-first order"""
+    payload = orjson.dumps({"t": moment.isoformat(), "id": doc_id})
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_page_cursor(cursor: str):
+    """Inverse of encode_page_cursor; raises HTTP 400 on a malformed cursor"""
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return to_utc_naive(datetime.fromisoformat(payload["t"])), str(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def keyset_page(repository, user_id: str, projection: Dict[str, int],
+                      limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    """One newest-first page of a user's history, keyed on (time_field, id).
     
-    completions = await completions_cursor.to_list(None)
-    completions = serialize_doc(completions)
+    Each page is a bounded index range scan that starts right after the
+    cursor, so deep pages cost the same as the first.
+    """
+    after = decode_page_cursor(cursor) if cursor else None
+    docs = await repository.page(user_id, limit + 1, projection, after)
+    time_field = repository.time_field
     
-    # Get mood entries from last 30 days
-    mood_cursor = db.mood_entries.find({
-        "user_id": user_id,
-        "created_at": {"$gte": thirty_days_ago}
-    }).sort("created_at", 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_page_cursor(docs[-1][time_field], docs[-1]["id"])
     
-    mood_entries = await mood_cursor.to_list(None)
-    mood_entries = serialize_doc(mood_entries)
+    return {"items": docs, "next_cursor": next_cursor}
+
+async def get_analytics_data(user_id: str, user: Optional[Dict] = None) -> Dict[str, Any]:
+    """Get comprehensive analytics data for user.
     
+    Pass the user document (with streak fields) when the caller already has it.
+    """
     # Prepare daily data
     daily_data = {}
     for i in range(30):
@@ -398,74 +1485,219 @@ async def get_analytics_data(user_id: str) -> Dict[str, Any]:
             "energy": None
         }
     
-    # Fill in completion data
-    for completion in completions:
-        try:
-            # Handle different datetime formats
-            if isinstance(completion["completed_at"], str):
-                if "T" in completion["completed_at"]:
-                    date = completion["completed_at"].split("T")[0]
-                else:
-                    date = completion["completed_at"][:10]
-            else:
-                date = completion["completed_at"].strftime("%Y-%m-%d")
-            
-            if date in daily_data:
-                daily_data[date]["completions"] += 1
-                daily_data[date]["xp_earned"] += completion.get("xp_earned", 0)
-        except Exception as e:
-            logger.error(f"Error processing completion date: {e}")
-            continue
+    # One pre-aggregated rollup document per active day, with the window
+    # totals summed server-side in the same round trip
+    days, totals = await storage.rollups.window(user_id, min(daily_data))
+    for rollup in days:
+        day = daily_data.get(rollup["date"])
+        if day is not None:
+            day.update(rollup)
     
-    # Fill in mood data
-    for mood in mood_entries:
-        try:
-            if isinstance(mood["created_at"], str):
-                if "T" in mood["created_at"]:
-                    date = mood["created_at"].split("T")[0]
-                else:
-                    date = mood["created_at"][:10]
-            else:
-                date = mood["created_at"].strftime("%Y-%m-%d")
-            
-            if date in daily_data:
-                daily_data[date]["mood"] = mood["mood_rating"]
-                daily_data[date]["energy"] = mood["energy_level"]
-        except Exception as e:
-            logger.error(f"Error processing mood date: {e}")
-            continue
+    totals = totals or {"total_completions": 0, "total_xp": 0, "avg_mood": 3, "avg_energy": 3}
     
-    # Calculate streaks
-    current_streak = 0
-    longest_streak = 0
-    temp_streak = 0
+    # Streaks are maintained incrementally on the user document
+    if user is None:
+        user = await get_cached_user(user_id, "user_streak")
     
-    for date in sorted(daily_data.keys()):
-        if daily_data[date]["completions"] > 0:
-            temp_streak += 1
-            longest_streak = max(longest_streak, temp_streak)
-        else:
-            temp_streak = 0
+    return {
+        "daily_data": list(daily_data.values()),
+        "total_completions": totals["total_completions"],
+        "total_xp": totals["total_xp"],
+        "current_streak": effective_streak(user) if user else 0,
+        "longest_streak": user.get("longest_streak", 0) if user else 0,
+        "avg_mood": totals["avg_mood"],
+        "avg_energy": totals["avg_energy"]
+    }
+
+async def get_recent_moods(user_id: str) -> List[Dict]:
+    """Latest mood entries, newest first"""
+    return await storage.moods.recent(user_id, 7, PROJECTIONS["mood_recent"])
+
+async def build_dashboard(user: Dict, habits: List[Dict], today_completions: int, mood_data: List[Dict],
+                          background_tasks: BackgroundTasks, defer_ai: bool) -> Dict[str, Any]:
+    """Assemble the dashboard from already-loaded user, habits and mood data"""
+    user_id = user["id"]
+    user = {**user, "current_streak": effective_streak(user)}
     
-    # Calculate current streak (from today backwards)
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    for i in range(30):
-        date = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-        if date in daily_data and daily_data[date]["completions"] > 0:
-            current_streak += 1
-        else:
-            break
+    # Calculate stats
+    current_level = calculate_level(user["total_xp"])
+    avatar_evolution = get_avatar_evolution(current_level)
+    
+    # Get AI coaching message
+    stored_message = user.pop("coach_message", None)
+    ai_message_token = None
+    ai_message_ready = True
+    if defer_ai and openai_client:
+        inputs = get_coaching_inputs(user, habits, mood_data)
+        ai_message_token = coaching_fingerprint(inputs)
+        ai_message = ai_message_cache.get(ai_message_token)
+        if not ai_message and stored_message and stored_message["token"] == ai_message_token:
+            ai_message = stored_message["message"]
+        if not ai_message:
+            ai_message = stored_message["message"] if stored_message else COACH_PLACEHOLDER_MESSAGE
+            ai_message_ready = False
+            background_tasks.add_task(refresh_coach_message, user_id, inputs, ai_message_token)
+    else:
+        ai_message = await get_ai_suggestion(user, habits, mood_data)
+        ai_message_ready = ai_message != AI_FALLBACK_MESSAGE
+    
+    # Generate daily quest
+    incomplete_habits = [h for h in habits if not h["completed_today"]]
+    daily_quest = None
+    if incomplete_habits:
+        quest_habit = incomplete_habits[0]  # Simple: pick first incomplete habit
+        daily_quest = {
+            "title": f"Complete {quest_habit['name']}",
+            "description": f"Earn {quest_habit['xp_reward']} XP by completing this habit",
+            "xp_reward": quest_habit["xp_reward"],
+            "habit_id": quest_habit["id"]
+        }
+    
+    # Get achievements
+    all_achievements = get_available_achievements()
+    user_achievements = user.get("achievements", [])
+    unlocked_achievements = [a for a in all_achievements if a.id in user_achievements]
     
     return {
-        "daily_data": list(daily_data.values()),
-        "total_completions": len(completions),
-        "total_xp": sum(c.get("xp_earned", 0) for c in completions),
-        "current_streak": current_streak,
-        "longest_streak": longest_streak,
-        "avg_mood": sum(m["mood_rating"] for m in mood_entries) / len(mood_entries) if mood_entries else 3,
-        "avg_energy": sum(m["energy_level"] for m in mood_entries) / len(mood_entries) if mood_entries else 3
+        "user": {
+            **user,
+            "current_level": current_level,
+            "avatar_evolution": avatar_evolution,
+            "xp_to_next_level": max(0, ((current_level) ** 2) * 100 - user["total_xp"])
+        },
+        "habits": habits,
+        "today_completions": today_completions,
+        "total_habits": len(habits),
+        "completion_rate": today_completions / len(habits) * 100 if habits else 0,
+        "ai_message": ai_message,
+        "ai_message_token": ai_message_token,
+        "ai_message_ready": ai_message_ready,
+        "daily_quest": daily_quest,
+        "recent_mood": mood_data[0] if mood_data else None,
+        "achievements": [{"id": a.id, "name": a.name, "description": a.description, "icon": a.icon} for a in unlocked_achievements]
     }
 
+def build_achievements_status(user: Dict) -> Dict[str, Any]:
+    """Every achievement with the user's unlock status"""
+    all_achievements = get_available_achievements()
+    user_achievements = user.get("achievements", [])
+    
+    achievements_status = []
+    for achievement in all_achievements:
+        achievements_status.append({
+            "id": achievement.id,
+            "name": achievement.name,
+            "description": achievement.description,
+            "icon": achievement.icon,
+            "reward_xp": achievement.reward_xp,
+            "unlocked": achievement.id in user_achievements,
+            "requirement": achievement.requirement
+        })
+    
+    return {"achievements": achievements_status}
+
+BOOTSTRAP_SECTIONS = ("dashboard", "habits", "analytics", "achievements")
+
+def parse_sections(sections: str) -> List[str]:
+    """Validate a comma-separated sections= selector"""
+    requested = [section.strip() for section in sections.split(",") if section.strip()]
+    unknown = [section for section in requested if section not in BOOTSTRAP_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown sections: {', '.join(unknown)}; expected any of {', '.join(BOOTSTRAP_SECTIONS)}"
+        )
+    return requested
+
+async def load_sections(user_id: str, sections: List[str], background_tasks: BackgroundTasks,
+                        defer_ai: bool = False) -> Dict[str, Any]:
+    """Load the requested UI sections, sharing one user and one habits fetch.
+    
+    Independent reads run concurrently; raises 404 if the user does not exist.
+    """
+    user = await get_cached_user(user_id, "user_dashboard")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    async def resolved(value):
+        return value
+    
+    needs_habits = "dashboard" in sections or "habits" in sections
+    (habits, today_completions), mood_data, analytics = await asyncio.gather(
+        get_habits_with_today_status(user_id) if needs_habits else resolved(([], 0)),
+        get_recent_moods(user_id) if "dashboard" in sections else resolved([]),
+        get_analytics_data(user_id, user) if "analytics" in sections else resolved(None)
+    )
+    
+    result = {}
+    for section in sections:
+        if section == "dashboard":
+            result["dashboard"] = await build_dashboard(
+                user, habits, today_completions, mood_data, background_tasks, defer_ai
+            )
+        elif section == "habits":
+            result["habits"] = habits
+        elif section == "analytics":
+            result["analytics"] = analytics
+        elif section == "achievements":
+            result["achievements"] = build_achievements_status(user)
+    return result
+
+def user_etag(user_id: str, version: int, variant: str) -> str:
+    """Weak ETag for a per-user read.
+    
+    The day is part of the tag because "today" views change at midnight
+    without any write; variant distinguishes routes and query strings.
+    """
+    variant_hash = hashlib.sha1(variant.encode()).hexdigest()[:12]
+    return f'W/"{user_id}-{version}-{day_key(datetime.utcnow())}-{variant_hash}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+async def conditional_user_response(request: Request, user_id: str, build: Callable[[], Awaitable[Any]],
+                                    cacheable: Optional[Callable[[Any], bool]] = None) -> Response:
+    """Answer If-None-Match with 304 after one version lookup, else build and tag the response.
+    
+    The version is read before building, so a write that lands mid-build
+    only makes the tag older than the body, never newer. Content that
+    cacheable() rejects (e.g. an AI fallback that should be retried) is
+    sent untagged with no-store.
+    """
+    user = await storage.users.get(user_id, PROJECTIONS["user_version"])
+    if user is None:
+        content = await build()
+        return content if isinstance(content, Response) else InstrumentedJSONResponse(content)
+    
+    # A write from another process leaves this process's caches behind the version.
+    # Local writes may have dropped the user entry alone, so the habits entry is
+    # checked against the version it was last confirmed under, not the user's.
+    version = user.get("version", 0)
+    cached = user_cache.peek(user_id)
+    if cached is not None and cached.get("version", 0) != version:
+        invalidate_user_cache(user_id)
+    if habits_checked_versions.peek(user_id) != version:
+        invalidate_habits_cache(user_id)
+        habits_checked_versions.set(user_id, version)
+    
+    etag = user_etag(user_id, version, f"{request.url.path}?{request.url.query}")
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    content = await build()
+    if cacheable is not None and not cacheable(content):
+        headers = {"Cache-Control": "no-store"}
+    response = content if isinstance(content, Response) else InstrumentedJSONResponse(content)
+    response.headers.update(headers)
+    return response
+
 # API Routes
 @app.get("/api/health")
 async def health_check():
@@ -475,17 +1707,17 @@ async def health_check():
 async def create_user(user: User):
     """Create a new user"""
     user_dict = user.dict()
-    await db.users.insert_one(user_dict)
-    return serialize_doc(user_dict)
+    await storage.users.insert(user_dict)
+    return user_dict
 
 @app.get("/api/users/{user_id}")
 async def get_user(user_id: str):
     """Get user profile"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_cached_user(user_id, "user_profile")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = serialize_doc(user)
+    user["current_streak"] = effective_streak(user)
     
     # Calculate current level
     user["current_level"] = calculate_level(user["total_xp"])
@@ -497,103 +1729,117 @@ async def get_user(user_id: str):
     
     return user
 
+@app.get("/api/users/{user_id}/export")
+async def export_user(user_id: str):
+    """Export a user's profile and full history as streamed NDJSON"""
+    user = await storage.users.get(user_id, PROJECTIONS["export"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return StreamingResponse(
+        export_user_ndjson(user),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="habitverse-{user_id}.ndjson"'}
+    )
+
+@app.post("/api/users/{user_id}/import")
+async def import_user(user_id: str, request: Request):
+    """Import NDJSON history (as produced by the export endpoint) into a user"""
+    user = await get_cached_user(user_id, "user_id")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return await import_user_ndjson(user_id, iter_request_lines(request))
+
 @app.post("/api/habits")
 async def create_habit(habit: Habit):
     """Create a new habit"""
     habit_dict = habit.dict()
     habit_dict["xp_reward"] = habit.difficulty * 10  # XP based on difficulty
-    await db.habits.insert_one(habit_dict)
-    return serialize_doc(habit_dict)
+    await storage.habits.insert(habit_dict)
+    invalidate_habits_cache(habit.user_id)
+    
+    # Only active habits count toward active_habits_count and habit_collector
+    new_achievements = []
+    if habit.is_active:
+        user = await storage.users.increment(
+            habit.user_id, {"active_habits_count": 1}, PROJECTIONS["user_achievement_counters"]
+        )
+        invalidate_user_cache(habit.user_id)
+        if user:
+            new_achievements = await evaluate_achievements(habit.user_id, user, "habit_created")
+    
+    return {
+        **habit_dict,
+        "new_achievements": [{"name": a.name, "description": a.description, "icon": a.icon} for a in new_achievements]
+    }
 
 @app.get("/api/habits/{user_id}")
 async def get_user_habits(user_id: str):
     """Get all habits for a user"""
-    habits_cursor = db.habits.find({"user_id": user_id, "is_active": True})
-    habits = await habits_cursor.to_list(None)
-    habits = serialize_doc(habits)
-    
-    # Add completion stats for today
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    for habit in habits:
-        completion = await db.habit_completions.find_one({
-            "user_id": user_id,
-            "habit_id": habit["id"],
-            "completed_at": {"$gte": today}
-        })
-        habit["completed_today"] = completion is not None
-    
-    return habits
+    habits, _ = await get_habits_with_today_status(user_id)
+    return InstrumentedJSONResponse(habits)
 
 @app.post("/api/habits/{habit_id}/complete")
-async def complete_habit(habit_id: str, request: HabitCompletionRequest):
-    """Mark a habit as completed"""
-    # Get habit details
-    habit = await db.habits.find_one({"id": habit_id})
+async def complete_habit(habit_id: str, request: HabitCompletionRequest, background_tasks: BackgroundTasks,
+                         include: Optional[str] = None):
+    """Mark a habit as completed.
+    
+    At most five round trips: habit lookup, completion insert, rollup upsert,
+    user update and (only when something is unlocked) the achievement award.
+    include= takes the same selector as /api/bootstrap and returns those
+    sections, already updated, under "sections" (AI coaching is deferred).
+    """
+    sections = parse_sections(include) if include else []
+    result = await record_habit_completion(habit_id, request)
+    if sections:
+        result["sections"] = await load_sections(request.user_id, sections, background_tasks, defer_ai=True)
+    return InstrumentedJSONResponse(result)
+
+async def record_habit_completion(habit_id: str, request: HabitCompletionRequest) -> Dict[str, Any]:
+    """Record one completion and apply it to the user"""
+    # Get habit details, from the user's cached active habits when possible
+    active_habits = await get_cached_active_habits(request.user_id, "habit_reward_by_id")
+    habit = next((h for h in active_habits if h["id"] == habit_id), None)
+    if habit is None:
+        habit = await storage.habits.get(habit_id, PROJECTIONS["habit_reward"])
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     
-    # Check if already completed today
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    existing = await db.habit_completions.find_one({
-        "user_id": request.user_id,
-        "habit_id": habit_id,
-        "completed_at": {"$gte": today}
-    })
-    
-    if existing:
-        return {"message": "Habit already completed today", "xp_earned": 0}
-    
     # Create completion record
+    now = datetime.utcnow()
     completion = HabitCompletion(
         user_id=request.user_id,
         habit_id=habit_id,
+        completed_at=now,
+        completed_on=day_key(now),
         xp_earned=habit["xp_reward"],
         mood_rating=request.mood_rating,
         energy_level=request.energy_level,
         notes=request.notes
     )
     
-    # Record completion
-    completion_dict = completion.dict()
-    await db.habit_completions.insert_one(completion_dict)
+    # Record completion; the (user_id, habit_id, completed_on) unique key
+    # rejects a second completion of the same habit on the same day
+    try:
+        await storage.completions.insert(completion.dict())
+    except DuplicateRecordError:
+        return {"message": "Habit already completed today", "xp_earned": 0}
+    await record_completion_rollup(request.user_id, completion.completed_at, completion.xp_earned)
     
-    # Update user XP and streak
-    user = await db.users.find_one({"id": request.user_id})
+    # Update user XP, streak and counters, then check for new achievements
+    user, new_achievements = await apply_completions_to_user(
+        request.user_id, completion.completed_on, completion.xp_earned, {habit["category"]: 1}
+    )
     if user:
-        new_xp = user["total_xp"] + completion.xp_earned
-        
-        # Calculate streak
-        yesterday = today - timedelta(days=1)
-        yesterday_completion = await db.habit_completions.find_one({
-            "user_id": request.user_id,
-            "completed_at": {"$gte": yesterday, "$lt": today}
-        })
-        
-        if yesterday_completion:
-            new_streak = user["current_streak"] + 1
-        else:
-            new_streak = 1
-        
-        # Update user
-        await db.users.update_one(
-            {"id": request.user_id},
-            {
-                "$set": {
-                    "total_xp": new_xp,
-                    "current_streak": new_streak,
-                    "longest_streak": max(user["longest_streak"], new_streak)
-                }
-            }
-        )
+        new_xp = user["total_xp"]
+        new_streak = user["current_streak"]
         
         # Check for level up
-        old_level = calculate_level(user["total_xp"])
+        old_level = calculate_level(new_xp - completion.xp_earned)
         new_level = calculate_level(new_xp)
         level_up = new_level > old_level
         
-        # Check for new achievements
-        new_achievements = await check_achievements(request.user_id)
-        
         return {
             "message": "Habit completed successfully!",
             "xp_earned": completion.xp_earned,
@@ -606,97 +1852,215 @@ async def complete_habit(habit_id: str, request: HabitCompletionRequest):
     
     return {"message": "Habit completed!", "xp_earned": completion.xp_earned}
 
+@app.post("/api/completions/batch")
+async def complete_habits_batch(request: BatchCompletionRequest):
+    """Complete many habits for one user in a single request.
+    
+    Uses at most one habit lookup, one bulk insert, one rollup upsert, one user update
+    and one achievement evaluation, however many items are sent. Each item
+    reports completed, already_completed or not_found.
+    """
+    habit_ids = {item.habit_id for item in request.items}
+    active_habits = await get_cached_active_habits(request.user_id, "habit_reward_by_id")
+    habits = {h["id"]: h for h in active_habits if h["id"] in habit_ids}
+    
+    # Inactive habits are not cached; look those up directly
+    missing_ids = list(habit_ids - habits.keys())
+    if missing_ids:
+        missing = await storage.habits.get_many(request.user_id, missing_ids, PROJECTIONS["habit_reward_by_id"])
+        habits.update({h["id"]: h for h in missing})
+    
+    now = datetime.utcnow()
+    results = []
+    completions = []
+    completion_items = []  # index into results for each entry in completions
+    seen = set()
+    for item in request.items:
+        habit = habits.get(item.habit_id)
+        if not habit:
+            results.append({"habit_id": item.habit_id, "status": "not_found", "xp_earned": 0})
+            continue
+        if item.habit_id in seen:
+            results.append({"habit_id": item.habit_id, "status": "already_completed", "xp_earned": 0})
+            continue
+        
+        seen.add(item.habit_id)
+        completion_items.append(len(results))
+        results.append({"habit_id": item.habit_id, "status": "completed", "xp_earned": habit["xp_reward"]})
+        completions.append(HabitCompletion(
+            user_id=request.user_id,
+            habit_id=item.habit_id,
+            completed_at=now,
+            completed_on=day_key(now),
+            xp_earned=habit["xp_reward"],
+            mood_rating=item.mood_rating,
+            energy_level=item.energy_level,
+            notes=item.notes
+        ).dict())
+    
+    # Unordered so one already-completed habit does not block the rest
+    if completions:
+        for index in await storage.completions.insert_many(completions):
+            result = results[completion_items[index]]
+            result["status"] = "already_completed"
+            result["xp_earned"] = 0
+    
+    completed = [r for r in results if r["status"] == "completed"]
+    xp_earned = sum(r["xp_earned"] for r in completed)
+    response = {
+        "results": results,
+        "completed": len(completed),
+        "xp_earned": xp_earned,
+        "new_achievements": []
+    }
+    if not completed:
+        return response
+    
+    category_counts = Counter(habits[r["habit_id"]]["category"] for r in completed)
+    await record_completion_rollup(request.user_id, now, xp_earned, completions=len(completed))
+    user, new_achievements = await apply_completions_to_user(request.user_id, day_key(now), xp_earned, category_counts)
+    if user:
+        response.update({
+            "total_xp": user["total_xp"],
+            "current_level": calculate_level(user["total_xp"]),
+            "level_up": calculate_level(user["total_xp"]) > calculate_level(user["total_xp"] - xp_earned),
+            "current_streak": user["current_streak"],
+            "new_achievements": [{"name": a.name, "description": a.description, "icon": a.icon} for a in new_achievements]
+        })
+    
+    return response
+
 @app.post("/api/mood")
 async def log_mood(mood: MoodEntry):
     """Log daily mood and energy"""
     mood_dict = mood.dict()
-    await db.mood_entries.insert_one(mood_dict)
+    await storage.moods.insert(mood_dict)
+    await record_mood_rollup(mood.user_id, mood.created_at, mood.mood_rating, mood.energy_level)
     
     # Check for mood tracking achievement
-    new_achievements = await check_achievements(mood.user_id)
+    new_achievements = []
+    user = await storage.users.increment(
+        mood.user_id, {"mood_entries_count": 1}, PROJECTIONS["user_achievement_counters"]
+    )
+    invalidate_user_cache(mood.user_id)
+    event_hub.publish(mood.user_id, "mood", {
+        "id": mood.id,
+        "mood_rating": mood.mood_rating,
+        "energy_level": mood.energy_level,
+        "created_at": mood.created_at
+    })
+    if user:
+        new_achievements = await evaluate_achievements(mood.user_id, user, "mood_logged")
     
     return {
-        **serialize_doc(mood_dict),
+        **mood_dict,
         "new_achievements": [{"name": a.name, "description": a.description, "icon": a.icon} for a in new_achievements]
     }
 
+@app.get("/api/completions/{user_id}/history")
+async def get_completion_history(user_id: str, limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    """Page through a user's completions, newest first"""
+    page = await keyset_page(storage.completions, user_id, PROJECTIONS["completion_history"], limit, cursor)
+    return InstrumentedJSONResponse(page)
+
+@app.get("/api/mood/{user_id}/history")
+async def get_mood_history(user_id: str, limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    """Page through a user's mood entries, newest first"""
+    page = await keyset_page(storage.moods, user_id, PROJECTIONS["mood_history"], limit, cursor)
+    return InstrumentedJSONResponse(page)
+
 @app.get("/api/dashboard/{user_id}")
-async def get_dashboard(user_id: str):
-    """Get dashboard data for user"""
-    # Get user data
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user = serialize_doc(user)
-    
-    # Get habits
-    habits_cursor = db.habits.find({"user_id": user_id, "is_active": True})
-    habits = await habits_cursor.to_list(None)
-    habits = serialize_doc(habits)
+async def get_dashboard(user_id: str, request: Request, background_tasks: BackgroundTasks, defer_ai: bool = False):
+    """Get dashboard data for user.
     
-    # Get recent mood data
-    mood_cursor = db.mood_entries.find({"user_id": user_id}).sort("created_at", -1).limit(7)
-    mood_data = await mood_cursor.to_list(None)
-    mood_data = serialize_doc(mood_data)
+    With defer_ai=true the response never waits on the model: it carries the
+    last stored coaching message (or a placeholder) plus ai_message_token,
+    and a fresh message is generated in the background for GET /api/coach.
+    """
+    async def build():
+        sections = await load_sections(user_id, ["dashboard"], background_tasks, defer_ai)
+        return sections["dashboard"]
     
-    # Get today's completions
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    completions_cursor = db.habit_completions.find({
-        "user_id": user_id,
-        "completed_at": {"$gte": today}
-    })
-    today_completions = await completions_cursor.to_list(None)
-    today_completions = serialize_doc(today_completions)
+    return await conditional_user_response(request, user_id, build, lambda dashboard: dashboard["ai_message_ready"])
+
+@app.get("/api/bootstrap/{user_id}")
+async def get_bootstrap(user_id: str, request: Request, background_tasks: BackgroundTasks,
+                        sections: str = ",".join(BOOTSTRAP_SECTIONS), defer_ai: bool = False):
+    """Get everything the UI needs in one request.
     
-    # Calculate stats
-    current_level = calculate_level(user["total_xp"])
-    avatar_evolution = get_avatar_evolution(current_level)
+    sections= selects any of dashboard, habits, analytics and achievements;
+    they share one user and habits fetch and load concurrently.
+    """
+    requested = parse_sections(sections)
+    return await conditional_user_response(
+        request, user_id, lambda: load_sections(user_id, requested, background_tasks, defer_ai),
+        lambda result: result.get("dashboard", {}).get("ai_message_ready", True)
+    )
+
+async def user_event_stream(user_id: str) -> AsyncIterator[bytes]:
+    """SSE frames for one subscriber, with comment heartbeats while idle.
     
-    # Get AI coaching message
-    ai_message = await get_ai_suggestion(user, habits, mood_data)
+    The pending queue.get() survives heartbeats instead of being wrapped in
+    wait_for, which can swallow the cancellation sent on client disconnect
+    when an event arrives at the same moment.
+    """
+    queue = event_hub.subscribe(user_id)
+    getter = None
+    try:
+        yield b"retry: 5000\n\n"
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=EVENT_HEARTBEAT_SECONDS)
+            if done:
+                payload, getter = getter.result(), None
+                yield payload
+            else:
+                yield b": heartbeat\n\n"
+    finally:
+        if getter is not None:
+            getter.cancel()
+        event_hub.unsubscribe(user_id, queue)
+
+@app.get("/api/events/{user_id}")
+async def stream_events(user_id: str):
+    """Stream progress, mood and achievement deltas as server-sent events"""
+    user = await get_cached_user(user_id, "user_id")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    # Generate daily quest
-    incomplete_habits = [h for h in habits if not any(c["habit_id"] == h["id"] for c in today_completions)]
-    daily_quest = None
-    if incomplete_habits:
-        quest_habit = incomplete_habits[0]  # Simple: pick first incomplete habit
-        daily_quest = {
-            "title": f"Complete {quest_habit['name']}",
-            "description": f"Earn {quest_habit['xp_reward']} XP by completing this habit",
-            "xp_reward": quest_habit["xp_reward"],
-            "habit_id": quest_habit["id"]
-        }
+    return StreamingResponse(
+        user_event_stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/coach/{user_id}")
+async def get_coach_message(user_id: str, token: Optional[str] = None):
+    """Get the coaching message generated for a deferred dashboard load"""
+    user = await get_cached_user(user_id, "user_coach_message")
+    # A user without a stored message projects to {}; only None means missing
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    # Get achievements
-    all_achievements = get_available_achievements()
-    user_achievements = user.get("achievements", [])
-    unlocked_achievements = [a for a in all_achievements if a.id in user_achievements]
+    stored_message = user.get("coach_message")
+    if token:
+        cached = ai_message_cache.get(token)
+        if cached:
+            return {"ready": True, "message": cached, "token": token}
+        if stored_message and stored_message["token"] == token:
+            return {"ready": True, "message": stored_message["message"], "token": token}
+        return {"ready": False, "message": stored_message["message"] if stored_message else None, "token": token}
     
-    return {
-        "user": {
-            **user,
-            "current_level": current_level,
-            "avatar_evolution": avatar_evolution,
-            "xp_to_next_level": max(0, ((current_level) ** 2) * 100 - user["total_xp"])
-        },
-        "habits": habits,
-        "today_completions": len(today_completions),
-        "total_habits": len(habits),
-        "completion_rate": len(today_completions) / len(habits) * 100 if habits else 0,
-        "ai_message": ai_message,
-        "daily_quest": daily_quest,
-        "recent_mood": mood_data[0] if mood_data else None,
-        "achievements": [{"id": a.id, "name": a.name, "description": a.description, "icon": a.icon} for a in unlocked_achievements]
-    }
+    if not stored_message:
+        return {"ready": False, "message": None, "token": None}
+    return {"ready": True, "message": stored_message["message"], "token": stored_message["token"]}
 
 @app.get("/api/suggestions/{user_id}")
 async def get_habit_suggestions(user_id: str):
     """Get AI-powered habit suggestions"""
     # Get user's current habits
-    habits_cursor = db.habits.find({"user_id": user_id, "is_active": True})
-    habits = await habits_cursor.to_list(None)
-    habits = serialize_doc(habits)
+    habits = await get_cached_active_habits(user_id, "habit_name_category")
     current_habits = [h["name"] for h in habits]
     
     # Get user interests from habit categories
@@ -710,40 +2074,34 @@ async def get_habit_suggestions(user_id: str):
 @app.get("/api/stats/{user_id}")
 async def get_user_stats(user_id: str):
     """Get detailed user statistics"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_cached_user(user_id, "user_stats")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = serialize_doc(user)
-    
-    # Get completion history
-    completions_cursor = db.habit_completions.find({"user_id": user_id}).sort("completed_at", -1).limit(30)
-    completions = await completions_cursor.to_list(None)
-    completions = serialize_doc(completions)
-    
-    # Calculate weekly progress
+    # Lifetime totals come from maintained counters; only the last week's
+    # completions are counted, over an index range
     week_ago = datetime.utcnow() - timedelta(days=7)
-    week_completions = [c for c in completions if datetime.fromisoformat(c["completed_at"].replace('Z', '+00:00')) >= week_ago]
+    week_completions = await storage.completions.count_since(user_id, week_ago)
     
-    # Get mood trends
-    mood_cursor = db.mood_entries.find({"user_id": user_id}).sort("created_at", -1).limit(14)
-    mood_data = await mood_cursor.to_list(None)
-    mood_data = serialize_doc(mood_data)
+    # Get mood trends (newest first)
+    recent_moods = await storage.moods.recent(user_id, 7, PROJECTIONS["mood_trend"])
     
     return {
-        "total_habits_completed": len(completions),
-        "week_completions": len(week_completions),
+        "total_habits_completed": user.get("completions_count", 0),
+        "week_completions": week_completions,
+        "active_habits": user.get("active_habits_count", 0),
+        "mood_entries": user.get("mood_entries_count", 0),
+        "category_completions": user.get("category_completions", {}),
         "current_level": calculate_level(user["total_xp"]),
         "avatar_evolution": get_avatar_evolution(calculate_level(user["total_xp"])),
-        "mood_trend": [m["mood_rating"] for m in mood_data[:7]],
-        "energy_trend": [m["energy_level"] for m in mood_data[:7]]
+        "mood_trend": [m["mood_rating"] for m in recent_moods],
+        "energy_trend": [m["energy_level"] for m in recent_moods]
     }
 
 @app.get("/api/analytics/{user_id}")
-async def get_analytics(user_id: str):
+async def get_analytics(user_id: str, request: Request):
     """Get comprehensive analytics data"""
-    analytics_data = await get_analytics_data(user_id)
-    return analytics_data
+    return await conditional_user_response(request, user_id, lambda: get_analytics_data(user_id))
 
 @app.get("/api/achievements")
 async def get_all_achievements():
@@ -752,29 +2110,41 @@ async def get_all_achievements():
     return {"achievements": [{"id": a.id, "name": a.name, "description": a.description, "icon": a.icon, "reward_xp": a.reward_xp} for a in achievements]}
 
 @app.get("/api/achievements/{user_id}")
-async def get_user_achievements(user_id: str):
+async def get_user_achievements(user_id: str, request: Request):
     """Get user's achievements status"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user = serialize_doc(user)
-    all_achievements = get_available_achievements()
-    user_achievements = user.get("achievements", [])
-    
-    achievements_status = []
-    for achievement in all_achievements:
-        achievements_status.append({
-            "id": achievement.id,
-            "name": achievement.name,
-            "description": achievement.description,
-            "icon": achievement.icon,
-            "reward_xp": achievement.reward_xp,
-            "unlocked": achievement.id in user_achievements,
-            "requirement": achievement.requirement
-        })
+    async def build():
+        user = await get_cached_user(user_id, "user_achievements")
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return build_achievements_status(user)
     
-    return {"achievements": achievements_status}
+    return await conditional_user_response(request, user_id, build)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Per-route latency, phase and query-count metrics in Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/indexes")
+async def get_index_stats():
+    """Report index usage per collection, flagging declared indexes that are missing"""
+    return {"engine": storage.engine, "collections": await storage.index_stats()}
+
+
+@app.get("/api/admin/cache")
+async def get_cache_stats():
+    """Report hit/miss/eviction counters for in-process caches"""
+    return {
+        "ai_coaching": ai_message_cache.stats(),
+        "ai_singleflight": ai_singleflight.stats(),
+        "users": user_cache.stats(),
+        "active_habits": active_habits_cache.stats()
+    }
+
+@app.get("/api/admin/events")
+async def get_event_stats():
+    """Report live event subscribers and delivery counters"""
+    return event_hub.stats()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,856 @@
+"""Storage backends for HabitVerse.
+
+server.py talks to repositories (users, habits, completions, moods and the
+daily rollups derived from them) instead of a database handle. Two engines
+implement them:
+
+- MotorStorage: MongoDB through Motor, the production engine.
+- MemoryStorage: plain dicts with the same secondary indexes kept by hand,
+  for unit tests, benchmarks and single-node demos. Data lives only as long
+  as the process.
+
+STORAGE_ENGINE=memory selects the in-memory engine; anything else uses Mongo.
+Reads take a Mongo-style inclusion projection ({"_id": 0, "field": 1, ...})
+so each call site keeps naming exactly the fields it needs, on either engine.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+import copy
+import logging
+import os
+
+from pymongo import IndexModel, UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+class DuplicateRecordError(Exception):
+    """A write collided with a unique key (id, or habit/day for completions)"""
+
+def to_utc_naive(moment: datetime) -> datetime:
+    """Naive UTC datetime, as Mongo stores it; naive input is taken to be UTC already"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+def day_key(moment: datetime) -> str:
+    """UTC calendar day used to bucket completions and moods"""
+    return to_utc_naive(moment).strftime("%Y-%m-%d")
+
+def previous_day(day: str) -> str:
+    return day_key(datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1))
+
+# Indexes declared per collection. Every filter/sort issued below should be
+# served by one of these; create_indexes is a no-op for indexes that already
+# exist with the same spec, so this is safe to run on every startup.
+INDEX_SPECS = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True, background=True),
+    ],
+    "habits": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True, background=True),
+        IndexModel([("user_id", ASCENDING), ("is_active", ASCENDING)], name="user_active", background=True),
+    ],
+    "habit_completions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True, background=True),
+        # one completion per habit per day, enforced by the database
+        IndexModel(
+            [("user_id", ASCENDING), ("habit_id", ASCENDING), ("completed_on", ASCENDING)],
+            name="user_habit_day_unique", unique=True, background=True,
+            partialFilterExpression={"completed_on": {"$exists": True}},
+        ),
+        # today's completions, date ranges and keyset-paginated history: {user_id, completed_at, id}
+        IndexModel(
+            [("user_id", ASCENDING), ("completed_at", DESCENDING), ("id", DESCENDING)],
+            name="user_completed_at_id", background=True,
+        ),
+    ],
+    "mood_entries": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True, background=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_created_at_id", background=True,
+        ),
+    ],
+    "daily_rollups": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_date_unique", unique=True, background=True),
+    ],
+}
+
+ROLLUP_DAY_FIELDS = ("date", "completions", "xp_earned", "mood", "energy")
+
+# Motor engine
+
+async def insert_many_skipping_duplicates(collection, docs: List[Dict]) -> Set[int]:
+    """Unordered insert_many; returns the indexes of docs rejected as duplicates"""
+    duplicates = set()
+    try:
+        await collection.insert_many([dict(doc) for doc in docs], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            duplicates.add(error["index"])
+    return duplicates
+
+async def insert_one_unique(collection, doc: Dict):
+    try:
+        await collection.insert_one(dict(doc))
+    except DuplicateKeyError as e:
+        raise DuplicateRecordError(str(e)) from e
+
+def completion_update_pipeline(day: str, xp_earned: int, category_counts: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Update pipeline that applies completions on `day` to the user's XP, counters and streak.
+    
+    The streak grows when the previous active day was yesterday, holds on a
+    repeat completion the same day and otherwise restarts at 1. Running it as
+    a single update makes it safe under concurrent completions.
+    """
+    yesterday = previous_day(day)
+    category_increments = {}
+    for key, count in category_counts.items():
+        field = f"category_completions.{key}"
+        category_increments[field] = {"$add": [{"$ifNull": [f"${field}", 0]}, count]}
+    
+    return [
+        {"$set": {
+            "total_xp": {"$add": [{"$ifNull": ["$total_xp", 0]}, xp_earned]},
+            "completions_count": {"$add": [{"$ifNull": ["$completions_count", 0]}, sum(category_counts.values())]},
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            **category_increments,
+            "current_streak": {"$switch": {
+                "branches": [
+                    {
+                        "case": {"$eq": ["$last_active_date", day]},
+                        "then": {"$max": [{"$ifNull": ["$current_streak", 0]}, 1]}
+                    },
+                    {
+                        "case": {"$eq": ["$last_active_date", yesterday]},
+                        "then": {"$add": [{"$ifNull": ["$current_streak", 0]}, 1]}
+                    }
+                ],
+                "default": 1
+            }},
+            "last_active_date": {"$literal": day}
+        }},
+        {"$set": {
+            "longest_streak": {"$max": [{"$ifNull": ["$longest_streak", 0]}, "$current_streak"]}
+        }}
+    ]
+
+class MotorUserRepository:
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def insert(self, user: Dict):
+        await insert_one_unique(self.collection, user)
+    
+    async def get(self, user_id: str, projection: Dict[str, int]) -> Optional[Dict]:
+        return await self.collection.find_one({"id": user_id}, projection)
+    
+    async def iter_all(self, projection: Dict[str, int], user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        async for user in self.collection.find({"id": user_id} if user_id else {}, projection):
+            yield user
+    
+    async def increment(self, user_id: str, counters: Dict[str, int], projection: Dict[str, int]) -> Optional[Dict]:
+        """Add to numeric fields and bump the version; returns the updated user"""
+        return await self.collection.find_one_and_update(
+            {"id": user_id},
+            {"$inc": {**counters, "version": 1}},
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def apply_completions(self, user_id: str, day: str, xp_earned: int, category_counts: Dict[str, int],
+                                projection: Dict[str, int]) -> Optional[Dict]:
+        """Apply completions on `day` to XP, counters and streak in one atomic update"""
+        return await self.collection.find_one_and_update(
+            {"id": user_id},
+            completion_update_pipeline(day, xp_earned, category_counts),
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def award_achievements(self, user_id: str, rewards: Dict[str, int]) -> List[str]:
+        """Add the achievements in rewards (id -> XP bonus) that are not yet held,
+        plus only their bonuses, and return the ids awarded. The check runs per id
+        inside one update, so a concurrent award of some ids never drops the rest."""
+        held = {"$ifNull": ["$achievements", []]}
+        before = await self.collection.find_one_and_update(
+            {"id": user_id, "achievements": {"$not": {"$all": list(rewards)}}},
+            [{"$set": {
+                "achievements": {"$concatArrays": [held, {"$filter": {
+                    "input": {"$literal": list(rewards)}, "as": "award", "cond": {"$not": {"$in": ["$$award", held]}}
+                }}]},
+                "total_xp": {"$add": [{"$ifNull": ["$total_xp", 0]}, *(
+                    {"$cond": [{"$in": [{"$literal": achievement_id}, held]}, 0, xp_bonus]}
+                    for achievement_id, xp_bonus in rewards.items()
+                )]},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+            }}],
+            projection={"_id": 0, "achievements": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return []
+        return [a for a in rewards if a not in before.get("achievements", [])]
+    
+    async def set_fields(self, user_id: str, fields: Dict[str, Any]):
+        await self.collection.update_one({"id": user_id}, {"$set": fields, "$inc": {"version": 1}})
+    
+    async def set_fields_many(self, fields_by_user: Dict[str, Dict[str, Any]]):
+        if fields_by_user:
+            await self.collection.bulk_write([
+                UpdateOne({"id": user_id}, {"$set": fields, "$inc": {"version": 1}})
+                for user_id, fields in fields_by_user.items()
+            ], ordered=False)
+    
+    async def bump_versions(self, user_id: Optional[str] = None):
+        await self.collection.update_many({"id": user_id} if user_id else {}, {"$inc": {"version": 1}})
+
+class MotorHabitRepository:
+    time_field = "created_at"
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def insert(self, habit: Dict):
+        await insert_one_unique(self.collection, habit)
+    
+    async def insert_many(self, habits: List[Dict]) -> Set[int]:
+        return await insert_many_skipping_duplicates(self.collection, habits)
+    
+    async def get(self, habit_id: str, projection: Dict[str, int]) -> Optional[Dict]:
+        return await self.collection.find_one({"id": habit_id}, projection)
+    
+    async def list_active(self, user_id: str, projection: Dict[str, int]) -> List[Dict]:
+        return await self.collection.find({"user_id": user_id, "is_active": True}, projection).to_list(None)
+    
+    async def get_many(self, user_id: str, habit_ids: List[str], projection: Dict[str, int]) -> List[Dict]:
+        return await self.collection.find({"id": {"$in": habit_ids}, "user_id": user_id}, projection).to_list(None)
+    
+    async def list_for_users(self, user_ids: List[str], projection: Dict[str, int]) -> List[Dict]:
+        return await self.collection.find({"user_id": {"$in": user_ids}}, projection).to_list(None)
+    
+    async def iter_for_user(self, user_id: str, projection: Dict[str, int], batch_size: int) -> AsyncIterator[Dict]:
+        """A user's documents, oldest first"""
+        cursor = self.collection.find({"user_id": user_id}, projection, batch_size=batch_size)
+        async for doc in cursor.sort(self.time_field, 1):
+            yield doc
+
+class MotorTimelineRepository:
+    """Per-user documents ordered by (time_field, id): completions and moods"""
+    time_field = "created_at"
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def insert(self, doc: Dict):
+        await insert_one_unique(self.collection, doc)
+    
+    async def insert_many(self, docs: List[Dict]) -> Set[int]:
+        return await insert_many_skipping_duplicates(self.collection, docs)
+    
+    async def page(self, user_id: str, limit: int, projection: Dict[str, int],
+                   after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        """Up to limit documents newest first, starting just past the `after` key"""
+        query: Dict[str, Any] = {"user_id": user_id}
+        if after:
+            moment, doc_id = after
+            query["$or"] = [
+                {self.time_field: {"$lt": moment}},
+                {self.time_field: moment, "id": {"$lt": doc_id}}
+            ]
+        cursor = self.collection.find(query, {**projection, self.time_field: 1, "id": 1})
+        return await cursor.sort([(self.time_field, -1), ("id", -1)]).limit(limit).to_list(None)
+    
+    async def iter_for_user(self, user_id: str, projection: Dict[str, int], batch_size: int) -> AsyncIterator[Dict]:
+        """A user's documents, oldest first"""
+        cursor = self.collection.find({"user_id": user_id}, projection, batch_size=batch_size)
+        async for doc in cursor.sort(self.time_field, 1):
+            yield doc
+
+class MotorCompletionRepository(MotorTimelineRepository):
+    time_field = "completed_at"
+    
+    async def habit_ids_since(self, user_id: str, since: datetime) -> List[str]:
+        docs = await self.collection.find(
+            {"user_id": user_id, "completed_at": {"$gte": since}}, {"_id": 0, "habit_id": 1}
+        ).to_list(None)
+        return [doc["habit_id"] for doc in docs]
+    
+    async def count_since(self, user_id: str, since: datetime) -> int:
+        totals = await self.collection.aggregate([
+            {"$match": {"user_id": user_id, "completed_at": {"$gte": since}}},
+            {"$group": {"_id": None, "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return totals[0]["count"] if totals else 0
+    
+    async def counts_by_habit(self, user_ids: List[str]) -> Dict[Tuple[str, str], int]:
+        rows = await self.collection.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {"_id": {"user_id": "$user_id", "habit_id": "$habit_id"}, "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {(row["_id"]["user_id"], row["_id"]["habit_id"]): row["count"] for row in rows}
+    
+    async def daily_totals(self, user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Rollup rows ({user_id, date, completions, xp_earned}) grouped from raw completions"""
+        pipeline = [
+            {"$match": {"user_id": user_id} if user_id else {}},
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$completed_at"}}
+                },
+                "completions": {"$sum": 1},
+                "xp_earned": {"$sum": "$xp_earned"}
+            }}
+        ]
+        async for row in self.collection.aggregate(pipeline, allowDiskUse=True):
+            yield {**row.pop("_id"), **row}
+
+class MotorMoodRepository(MotorTimelineRepository):
+    time_field = "created_at"
+    
+    async def recent(self, user_id: str, limit: int, projection: Dict[str, int]) -> List[Dict]:
+        cursor = self.collection.find({"user_id": user_id}, projection)
+        return await cursor.sort("created_at", -1).limit(limit).to_list(None)
+    
+    async def counts_by_user(self, user_ids: List[str]) -> Dict[str, int]:
+        rows = await self.collection.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows}
+    
+    async def daily_summaries(self, user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Rollup rows ({user_id, date, mood, energy, mood_at, sums, count}); the day's latest entry sets mood/energy"""
+        pipeline = [
+            {"$match": {"user_id": user_id} if user_id else {}},
+            {"$sort": {"created_at": 1}},
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                },
+                "mood": {"$last": "$mood_rating"},
+                "energy": {"$last": "$energy_level"},
+                "mood_at": {"$last": "$created_at"},
+                "mood_sum": {"$sum": "$mood_rating"},
+                "energy_sum": {"$sum": "$energy_level"},
+                "mood_count": {"$sum": 1}
+            }}
+        ]
+        async for row in self.collection.aggregate(pipeline, allowDiskUse=True):
+            yield {**row.pop("_id"), **row}
+
+class MotorRollupRepository:
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def add_completions(self, user_id: str, date: str, completions: int, xp_earned: int):
+        await self.collection.update_one(
+            {"user_id": user_id, "date": date},
+            {"$inc": {"completions": completions, "xp_earned": xp_earned}},
+            upsert=True
+        )
+    
+    async def add_mood(self, user_id: str, date: str, created_at: datetime, mood_rating: int, energy_level: int):
+        """Add an entry to the day's sums; it sets mood/energy only if no later entry (mood_at) already has"""
+        is_latest = {"$gte": [created_at, {"$ifNull": ["$mood_at", created_at]}]}
+        await self.collection.update_one(
+            {"user_id": user_id, "date": date},
+            [{"$set": {
+                "mood": {"$cond": [is_latest, mood_rating, "$mood"]},
+                "energy": {"$cond": [is_latest, energy_level, "$energy"]},
+                "mood_at": {"$max": ["$mood_at", created_at]},
+                "mood_sum": {"$add": [{"$ifNull": ["$mood_sum", 0]}, mood_rating]},
+                "energy_sum": {"$add": [{"$ifNull": ["$energy_sum", 0]}, energy_level]},
+                "mood_count": {"$add": [{"$ifNull": ["$mood_count", 0]}, 1]}
+            }}],
+            upsert=True
+        )
+    
+    async def active_dates(self, user_id: str) -> AsyncIterator[str]:
+        """Dates with at least one completion, ascending"""
+        cursor = self.collection.find({"user_id": user_id, "completions": {"$gt": 0}}, {"_id": 0, "date": 1})
+        async for rollup in cursor.sort("date", 1):
+            yield rollup["date"]
+    
+    async def window(self, user_id: str, since: str) -> Tuple[List[Dict], Optional[Dict]]:
+        """Rollups from `since` on, plus their totals, in one round trip"""
+        result = await self.collection.aggregate([
+            {"$match": {"user_id": user_id, "date": {"$gte": since}}},
+            {"$facet": {
+                "days": [
+                    {"$project": {"_id": 0, **{field: 1 for field in ROLLUP_DAY_FIELDS}}}
+                ],
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total_completions": {"$sum": "$completions"},
+                        "total_xp": {"$sum": "$xp_earned"},
+                        "mood_sum": {"$sum": "$mood_sum"},
+                        "energy_sum": {"$sum": "$energy_sum"},
+                        "mood_count": {"$sum": "$mood_count"}
+                    }},
+                    {"$project": {
+                        "_id": 0,
+                        "total_completions": 1,
+                        "total_xp": 1,
+                        "avg_mood": {"$cond": [
+                            {"$gt": ["$mood_count", 0]}, {"$divide": ["$mood_sum", "$mood_count"]}, 3
+                        ]},
+                        "avg_energy": {"$cond": [
+                            {"$gt": ["$mood_count", 0]}, {"$divide": ["$energy_sum", "$mood_count"]}, 3
+                        ]}
+                    }}
+                ]
+            }}
+        ]).to_list(None)
+        totals = result[0]["totals"]
+        return result[0]["days"], totals[0] if totals else None
+    
+    async def delete(self, user_id: Optional[str] = None):
+        await self.collection.delete_many({"user_id": user_id} if user_id else {})
+    
+    async def upsert_many(self, rows: List[Dict]):
+        """Set fields on the (user_id, date) rollup of each row, creating it if needed"""
+        if rows:
+            await self.collection.bulk_write([
+                UpdateOne(
+                    {"user_id": row["user_id"], "date": row["date"]},
+                    {"$set": {k: v for k, v in row.items() if k not in ("user_id", "date")}},
+                    upsert=True
+                )
+                for row in rows
+            ], ordered=False)
+
+class MotorStorage:
+    engine = "mongo"
+    
+    def __init__(self, database, client=None):
+        self.database = database
+        self.client = client
+        self.users = MotorUserRepository(database.users)
+        self.habits = MotorHabitRepository(database.habits)
+        self.completions = MotorCompletionRepository(database.habit_completions)
+        self.moods = MotorMoodRepository(database.mood_entries)
+        self.rollups = MotorRollupRepository(database.daily_rollups)
+    
+    async def ensure_indexes(self):
+        """Build all declared indexes, logging (not raising) per-collection failures"""
+        for collection_name, indexes in INDEX_SPECS.items():
+            try:
+                created = await self.database[collection_name].create_indexes(indexes)
+                logger.info(f"Indexes ready on {collection_name}: {', '.join(created)}")
+            except PyMongoError as e:
+                logger.error(f"Index build failed on {collection_name}: {e}")
+    
+    async def index_stats(self) -> Dict[str, Any]:
+        """Index usage per collection, flagging declared indexes that are missing"""
+        collections = {}
+        for collection_name, indexes in INDEX_SPECS.items():
+            declared = {index.document["name"] for index in indexes}
+            try:
+                stats = await self.database[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+            except PyMongoError as e:
+                logger.error(f"Index stats failed on {collection_name}: {e}")
+                stats = []
+            
+            present = set()
+            index_usage = []
+            for stat in stats:
+                present.add(stat["name"])
+                index_usage.append({
+                    "name": stat["name"],
+                    "key": dict(stat["key"]),
+                    "accesses": stat["accesses"]["ops"],
+                    "since": stat["accesses"]["since"].isoformat(),
+                    "declared": stat["name"] in declared
+                })
+            
+            collections[collection_name] = {
+                "indexes": sorted(index_usage, key=lambda i: i["accesses"], reverse=True),
+                "missing": sorted(declared - present)
+            }
+        return collections
+    
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+# In-memory engine. Every method runs without awaiting, so each call is
+# atomic on the event loop, matching the single-document atomicity the
+# Motor engine relies on.
+
+def project(doc: Dict, projection: Dict[str, int]) -> Dict:
+    """Apply a Mongo-style projection, copying nested values so callers can mutate freely"""
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        items = ((field, doc[field]) for field in included if field in doc)
+    else:
+        items = ((field, value) for field, value in doc.items() if projection.get(field, 1))
+    return {field: copy.deepcopy(value) if isinstance(value, (dict, list)) else value for field, value in items}
+
+def stored_value(value: Any) -> Any:
+    """Deep copy of a value as Mongo would store it: datetimes become naive UTC"""
+    if isinstance(value, datetime):
+        return to_utc_naive(value)
+    if isinstance(value, dict):
+        return {key: stored_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [stored_value(item) for item in value]
+    return copy.deepcopy(value)
+
+def stored(doc: Dict) -> Dict:
+    """Private copy of an incoming document, without any Mongo _id"""
+    return {field: stored_value(value) for field, value in doc.items() if field != "_id"}
+
+class MemoryUserRepository:
+    def __init__(self):
+        self.by_id: Dict[str, Dict] = {}
+    
+    async def insert(self, user: Dict):
+        if user["id"] in self.by_id:
+            raise DuplicateRecordError(f"user {user['id']} exists")
+        self.by_id[user["id"]] = stored(user)
+    
+    async def get(self, user_id: str, projection: Dict[str, int]) -> Optional[Dict]:
+        user = self.by_id.get(user_id)
+        return project(user, projection) if user is not None else None
+    
+    async def iter_all(self, projection: Dict[str, int], user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        user_ids = [user_id] if user_id else list(self.by_id)
+        for uid in user_ids:
+            user = self.by_id.get(uid)
+            if user is not None:
+                yield project(user, projection)
+    
+    async def increment(self, user_id: str, counters: Dict[str, int], projection: Dict[str, int]) -> Optional[Dict]:
+        user = self.by_id.get(user_id)
+        if user is None:
+            return None
+        for field, amount in {**counters, "version": 1}.items():
+            user[field] = user.get(field, 0) + amount
+        return project(user, projection)
+    
+    async def apply_completions(self, user_id: str, day: str, xp_earned: int, category_counts: Dict[str, int],
+                                projection: Dict[str, int]) -> Optional[Dict]:
+        user = self.by_id.get(user_id)
+        if user is None:
+            return None
+        user["total_xp"] = user.get("total_xp", 0) + xp_earned
+        user["completions_count"] = user.get("completions_count", 0) + sum(category_counts.values())
+        user["version"] = user.get("version", 0) + 1
+        categories = user.setdefault("category_completions", {})
+        for key, count in category_counts.items():
+            categories[key] = categories.get(key, 0) + count
+        
+        last_active_date = user.get("last_active_date")
+        if last_active_date == day:
+            user["current_streak"] = max(user.get("current_streak", 0), 1)
+        elif last_active_date == previous_day(day):
+            user["current_streak"] = user.get("current_streak", 0) + 1
+        else:
+            user["current_streak"] = 1
+        user["last_active_date"] = day
+        user["longest_streak"] = max(user.get("longest_streak", 0), user["current_streak"])
+        return project(user, projection)
+    
+    async def award_achievements(self, user_id: str, rewards: Dict[str, int]) -> List[str]:
+        user = self.by_id.get(user_id)
+        if user is None:
+            return []
+        held = user.setdefault("achievements", [])
+        awarded = [a for a in rewards if a not in held]
+        if awarded:
+            held.extend(awarded)
+            user["total_xp"] = user.get("total_xp", 0) + sum(rewards[a] for a in awarded)
+            user["version"] = user.get("version", 0) + 1
+        return awarded
+    
+    async def set_fields(self, user_id: str, fields: Dict[str, Any]):
+        user = self.by_id.get(user_id)
+        if user is not None:
+            user.update(stored(fields))
+            user["version"] = user.get("version", 0) + 1
+    
+    async def set_fields_many(self, fields_by_user: Dict[str, Dict[str, Any]]):
+        for user_id, fields in fields_by_user.items():
+            await self.set_fields(user_id, fields)
+    
+    async def bump_versions(self, user_id: Optional[str] = None):
+        if user_id is None:
+            users = list(self.by_id.values())
+        else:
+            users = [self.by_id[user_id]] if user_id in self.by_id else []
+        for user in users:
+            user["version"] = user.get("version", 0) + 1
+
+class MemoryHabitRepository:
+    time_field = "created_at"
+    
+    def __init__(self):
+        self.by_id: Dict[str, Dict] = {}
+        self.ids_by_user: Dict[str, List[str]] = defaultdict(list)  # insertion order
+    
+    async def insert(self, habit: Dict):
+        if habit["id"] in self.by_id:
+            raise DuplicateRecordError(f"habit {habit['id']} exists")
+        self.by_id[habit["id"]] = stored(habit)
+        self.ids_by_user[habit["user_id"]].append(habit["id"])
+    
+    async def insert_many(self, habits: List[Dict]) -> Set[int]:
+        duplicates = set()
+        for i, habit in enumerate(habits):
+            try:
+                await self.insert(habit)
+            except DuplicateRecordError:
+                duplicates.add(i)
+        return duplicates
+    
+    async def get(self, habit_id: str, projection: Dict[str, int]) -> Optional[Dict]:
+        habit = self.by_id.get(habit_id)
+        return project(habit, projection) if habit is not None else None
+    
+    def _for_user(self, user_id: str) -> Iterable[Dict]:
+        return (self.by_id[habit_id] for habit_id in self.ids_by_user.get(user_id, ()))
+    
+    async def list_active(self, user_id: str, projection: Dict[str, int]) -> List[Dict]:
+        return [project(h, projection) for h in self._for_user(user_id) if h.get("is_active")]
+    
+    async def get_many(self, user_id: str, habit_ids: List[str], projection: Dict[str, int]) -> List[Dict]:
+        habits = (self.by_id.get(habit_id) for habit_id in habit_ids)
+        return [project(h, projection) for h in habits if h is not None and h["user_id"] == user_id]
+    
+    async def list_for_users(self, user_ids: List[str], projection: Dict[str, int]) -> List[Dict]:
+        return [project(h, projection) for user_id in user_ids for h in self._for_user(user_id)]
+    
+    async def iter_for_user(self, user_id: str, projection: Dict[str, int], batch_size: int) -> AsyncIterator[Dict]:
+        for habit in sorted(self._for_user(user_id), key=lambda h: h[self.time_field]):
+            yield project(habit, projection)
+
+class MemoryTimelineRepository:
+    """Per-user documents kept in a (time_field, id) sorted index per user"""
+    time_field = "created_at"
+    
+    def __init__(self):
+        self.by_id: Dict[str, Dict] = {}
+        self.keys_by_user: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+    
+    def _check_unique(self, doc: Dict):
+        if doc["id"] in self.by_id:
+            raise DuplicateRecordError(f"{doc['id']} exists")
+    
+    def _index(self, doc: Dict):
+        # Sorted insert first: if it fails nothing has been recorded
+        insort(self.keys_by_user[doc["user_id"]], (doc[self.time_field], doc["id"]))
+        self.by_id[doc["id"]] = doc
+    
+    async def insert(self, doc: Dict):
+        self._check_unique(doc)
+        self._index(stored(doc))
+    
+    async def insert_many(self, docs: List[Dict]) -> Set[int]:
+        duplicates = set()
+        for i, doc in enumerate(docs):
+            try:
+                await self.insert(doc)
+            except DuplicateRecordError:
+                duplicates.add(i)
+        return duplicates
+    
+    def _since(self, user_id: str, since: datetime) -> Iterable[Dict]:
+        keys = self.keys_by_user.get(user_id, [])
+        start = bisect_left(keys, (since, ""))
+        return (self.by_id[doc_id] for _, doc_id in keys[start:])
+    
+    def _newest(self, user_id: str, limit: int, before: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        keys = self.keys_by_user.get(user_id, [])
+        end = bisect_left(keys, before) if before else len(keys)
+        return [self.by_id[doc_id] for _, doc_id in reversed(keys[max(0, end - limit):end])]
+    
+    async def page(self, user_id: str, limit: int, projection: Dict[str, int],
+                   after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        projection = {**projection, self.time_field: 1, "id": 1}
+        return [project(doc, projection) for doc in self._newest(user_id, limit, after)]
+    
+    async def iter_for_user(self, user_id: str, projection: Dict[str, int], batch_size: int) -> AsyncIterator[Dict]:
+        for _, doc_id in list(self.keys_by_user.get(user_id, [])):
+            yield project(self.by_id[doc_id], projection)
+    
+    def _docs(self, user_id: Optional[str]) -> Iterable[Dict]:
+        if user_id is None:
+            return self.by_id.values()
+        return (self.by_id[doc_id] for _, doc_id in self.keys_by_user.get(user_id, []))
+
+class MemoryCompletionRepository(MemoryTimelineRepository):
+    time_field = "completed_at"
+    
+    def __init__(self):
+        super().__init__()
+        self.habit_days: Set[Tuple[str, str, str]] = set()
+    
+    async def insert(self, doc: Dict):
+        self._check_unique(doc)
+        habit_day = (doc["user_id"], doc["habit_id"], doc.get("completed_on"))
+        if doc.get("completed_on") is not None and habit_day in self.habit_days:
+            raise DuplicateRecordError(f"habit {doc['habit_id']} already completed on {doc['completed_on']}")
+        self._index(stored(doc))
+        if doc.get("completed_on") is not None:
+            self.habit_days.add(habit_day)
+    
+    async def habit_ids_since(self, user_id: str, since: datetime) -> List[str]:
+        return [doc["habit_id"] for doc in self._since(user_id, since)]
+    
+    async def count_since(self, user_id: str, since: datetime) -> int:
+        keys = self.keys_by_user.get(user_id, [])
+        return len(keys) - bisect_left(keys, (since, ""))
+    
+    async def counts_by_habit(self, user_ids: List[str]) -> Dict[Tuple[str, str], int]:
+        counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        for user_id in user_ids:
+            for doc in self._docs(user_id):
+                counts[(user_id, doc["habit_id"])] += 1
+        return dict(counts)
+    
+    async def daily_totals(self, user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        rows: Dict[Tuple[str, str], Dict] = {}
+        for doc in list(self._docs(user_id)):
+            key = (doc["user_id"], day_key(doc["completed_at"]))
+            row = rows.setdefault(key, {"user_id": key[0], "date": key[1], "completions": 0, "xp_earned": 0})
+            row["completions"] += 1
+            row["xp_earned"] += doc["xp_earned"]
+        for row in rows.values():
+            yield row
+
+class MemoryMoodRepository(MemoryTimelineRepository):
+    time_field = "created_at"
+    
+    async def recent(self, user_id: str, limit: int, projection: Dict[str, int]) -> List[Dict]:
+        return [project(doc, projection) for doc in self._newest(user_id, limit)]
+    
+    async def counts_by_user(self, user_ids: List[str]) -> Dict[str, int]:
+        return {user_id: len(self.keys_by_user[user_id]) for user_id in user_ids if self.keys_by_user.get(user_id)}
+    
+    async def daily_summaries(self, user_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        rows: Dict[Tuple[str, str], Dict] = {}
+        for doc in sorted(self._docs(user_id), key=lambda d: d["created_at"]):
+            key = (doc["user_id"], day_key(doc["created_at"]))
+            row = rows.setdefault(key, {
+                "user_id": key[0], "date": key[1], "mood_sum": 0, "energy_sum": 0, "mood_count": 0
+            })
+            row["mood"] = doc["mood_rating"]
+            row["energy"] = doc["energy_level"]
+            row["mood_at"] = doc["created_at"]
+            row["mood_sum"] += doc["mood_rating"]
+            row["energy_sum"] += doc["energy_level"]
+            row["mood_count"] += 1
+        for row in rows.values():
+            yield row
+
+class MemoryRollupRepository:
+    def __init__(self):
+        self.by_user: Dict[str, Dict[str, Dict]] = defaultdict(dict)  # user_id -> date -> rollup
+    
+    def _rollup(self, user_id: str, date: str) -> Dict:
+        days = self.by_user[user_id]
+        if date not in days:
+            days[date] = {"user_id": user_id, "date": date}
+        return days[date]
+    
+    async def add_completions(self, user_id: str, date: str, completions: int, xp_earned: int):
+        rollup = self._rollup(user_id, date)
+        rollup["completions"] = rollup.get("completions", 0) + completions
+        rollup["xp_earned"] = rollup.get("xp_earned", 0) + xp_earned
+    
+    async def add_mood(self, user_id: str, date: str, created_at: datetime, mood_rating: int, energy_level: int):
+        rollup = self._rollup(user_id, date)
+        created_at = to_utc_naive(created_at)
+        if created_at >= rollup.get("mood_at", created_at):
+            rollup["mood"] = mood_rating
+            rollup["energy"] = energy_level
+            rollup["mood_at"] = created_at
+        for field, amount in (("mood_sum", mood_rating), ("energy_sum", energy_level), ("mood_count", 1)):
+            rollup[field] = rollup.get(field, 0) + amount
+    
+    async def active_dates(self, user_id: str) -> AsyncIterator[str]:
+        days = self.by_user.get(user_id, {})
+        for date in sorted(days):
+            if days[date].get("completions", 0) > 0:
+                yield date
+    
+    async def window(self, user_id: str, since: str) -> Tuple[List[Dict], Optional[Dict]]:
+        rollups = [r for date, r in self.by_user.get(user_id, {}).items() if date >= since]
+        if not rollups:
+            return [], None
+        
+        mood_count = sum(r.get("mood_count", 0) for r in rollups)
+        totals = {
+            "total_completions": sum(r.get("completions", 0) for r in rollups),
+            "total_xp": sum(r.get("xp_earned", 0) for r in rollups),
+            "avg_mood": sum(r.get("mood_sum", 0) for r in rollups) / mood_count if mood_count else 3,
+            "avg_energy": sum(r.get("energy_sum", 0) for r in rollups) / mood_count if mood_count else 3
+        }
+        return [{field: r[field] for field in ROLLUP_DAY_FIELDS if field in r} for r in rollups], totals
+    
+    async def delete(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self.by_user.clear()
+        else:
+            self.by_user.pop(user_id, None)
+    
+    async def upsert_many(self, rows: List[Dict]):
+        for row in rows:
+            self._rollup(row["user_id"], row["date"]).update(row)
+
+class MemoryStorage:
+    engine = "memory"
+    
+    # Secondary indexes maintained by the repositories above, reported by index_stats
+    INDEXES = {
+        "users": ["id"],
+        "habits": ["id", "user_id (insertion order)"],
+        "habit_completions": ["id", "user_id, completed_at, id (sorted)", "user_id, habit_id, completed_on (unique)"],
+        "mood_entries": ["id", "user_id, created_at, id (sorted)"],
+        "daily_rollups": ["user_id, date"],
+    }
+    
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.habits = MemoryHabitRepository()
+        self.completions = MemoryCompletionRepository()
+        self.moods = MemoryMoodRepository()
+        self.rollups = MemoryRollupRepository()
+    
+    async def ensure_indexes(self):
+        """Indexes are maintained on every write; nothing to build"""
+    
+    async def index_stats(self) -> Dict[str, Any]:
+        return {
+            name: {"indexes": [{"name": index, "declared": True} for index in indexes], "missing": []}
+            for name, indexes in self.INDEXES.items()
+        }
+    
+    def close(self):
+        pass
+
+def create_storage(wrap_database=None):
+    """Build the engine named by STORAGE_ENGINE (mongo by default).
+    
+    wrap_database, if given, wraps the Motor database handle (used for
+    request instrumentation); it is ignored by the in-memory engine.
+    """
+    engine = os.environ.get("STORAGE_ENGINE", "mongo").lower()
+    if engine == "memory":
+        logger.info("Using in-memory storage; data is lost on restart")
+        return MemoryStorage()
+    
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    database = client[os.environ.get("DB_NAME", "habitverse")]
+    if wrap_database is not None:
+        database = wrap_database(database)
+    return MotorStorage(database, client)
@@ -0,0 +1,98 @@
+"""Offline fixtures: the FastAPI app over an in-process mongomock database.
+
+The database is wrapped in server.InstrumentedDatabase, as in production,
+so query budgets are read from the same per-request log that feeds
+/api/metrics.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import server  # noqa: E402
+from storage import MemoryStorage, MotorStorage  # noqa: E402
+
+class QueryLog:
+    """Per-request query logs collected from the metrics middleware, in order"""
+    
+    def __init__(self):
+        self.requests = []  # (method, route, RequestMetrics)
+    
+    def observe(self, method: str, route: str, metrics: server.RequestMetrics):
+        self.requests.append((method, route, metrics))
+    
+    @property
+    def queries(self):
+        return [label for _, _, metrics in self.requests for label, _ in metrics.queries]
+    
+    @contextmanager
+    def budget(self, max_queries: int):
+        """Fail if requests made in the block issue more than max_queries commands"""
+        start = len(self.requests)
+        yield
+        issued = [label for _, _, metrics in self.requests[start:] for label, _ in metrics.queries]
+        assert len(issued) <= max_queries, (
+            f"{len(issued)} queries issued, budget is {max_queries}: {', '.join(issued)}"
+        )
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def use_storage(monkeypatch, storage):
+    """Point server at storage, with no AI client and cold caches"""
+    monkeypatch.setattr(server, "storage", storage)
+    monkeypatch.setattr(server, "openai_client", None)
+    server.user_cache.clear()
+    server.active_habits_cache.clear()
+    server.ai_message_cache.clear()
+
+async def asgi_client():
+    await server.storage.ensure_indexes()
+    transport = httpx.ASGITransport(app=server.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+@pytest.fixture
+def query_log(monkeypatch):
+    """Point server at instrumented Motor storage over a fresh mongomock database"""
+    log = QueryLog()
+    monkeypatch.setattr(server, "metrics_registry", server.MetricsRegistry())
+    server.metrics_registry.listeners.append(log.observe)
+    use_storage(monkeypatch, MotorStorage(server.InstrumentedDatabase(AsyncMongoMockClient()["habitverse_test"])))
+    return log
+
+@pytest.fixture
+async def api(query_log):
+    async with await asgi_client() as client:
+        yield client
+
+@pytest.fixture(params=["mongo", "memory"])
+async def engine_api(request, monkeypatch):
+    """The API over each storage engine in turn (Motor on mongomock, then in-memory)"""
+    if request.param == "memory":
+        use_storage(monkeypatch, MemoryStorage())
+    else:
+        use_storage(monkeypatch, MotorStorage(server.InstrumentedDatabase(AsyncMongoMockClient()["habitverse_test"])))
+    async with await asgi_client() as client:
+        yield client
+
+@pytest.fixture
+def create_user():
+    """Factory: create a user with habit_count habits, alternating fitness and Deep Work"""
+    async def create(api, habit_count: int = 2):
+        response = await api.post("/api/users", json={"username": "tester", "email": "tester@example.com"})
+        user_id = response.json()["id"]
+        habit_ids = []
+        for i in range(habit_count):
+            response = await api.post("/api/habits", json={
+                "user_id": user_id, "name": f"habit {i}", "description": "test habit",
+                "category": "fitness" if i % 2 == 0 else "Deep Work", "difficulty": 2
+            })
+            habit_ids.append(response.json()["id"])
+        return user_id, habit_ids
+    return create
@@ -0,0 +1,77 @@
+"""DocumentCache must never cache a document loaded before a concurrent write."""
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def make_loader(values, started: asyncio.Event, release: asyncio.Event):
+    async def load():
+        value = values["current"]
+        started.set()
+        await release.wait()
+        return value
+    return load
+
+@pytest.mark.parametrize("drop", ["invalidate", "clear"])
+async def test_load_overlapping_write_is_not_cached(drop):
+    cache = server.DocumentCache("test", 10, 60)
+    values = {"current": {"version": 1}}
+    started, release = asyncio.Event(), asyncio.Event()
+    
+    read = asyncio.create_task(cache.get("u1", make_loader(values, started, release)))
+    await started.wait()
+    values["current"] = {"version": 2}
+    if drop == "invalidate":
+        cache.invalidate("u1")
+    else:
+        cache.clear()
+    release.set()
+    
+    assert await read == {"version": 1}
+    assert cache.peek("u1") is None
+    assert cache.stats()["stale_loads"] == 1
+    
+    async def load():
+        return values["current"]
+    assert await cache.get("u1", load) == {"version": 2}
+    assert cache.peek("u1") == {"version": 2}
+
+async def test_invalidating_other_keys_keeps_load():
+    cache = server.DocumentCache("test", 10, 60)
+    started, release = asyncio.Event(), asyncio.Event()
+    read = asyncio.create_task(cache.get("u1", make_loader({"current": {"version": 1}}, started, release)))
+    await started.wait()
+    cache.invalidate("u2")
+    release.set()
+    
+    assert await read == {"version": 1}
+    assert cache.peek("u1") == {"version": 1}
+    assert cache._generations == {} and not cache._loading
+
+async def test_version_drift_drops_habits_after_local_user_write(api, create_user):
+    user_id, _ = await create_user(api, 1)
+    path = f"/api/bootstrap/{user_id}?sections=habits"
+    assert len((await api.get(path)).json()["habits"]) == 1
+    
+    # Another process adds a habit, then a local write drops only the user entry
+    await server.storage.habits.insert(server.Habit(user_id=user_id, name="Run", description="drift test",
+                                                    category="fitness", difficulty=1).dict())
+    await server.storage.users.bump_versions(user_id)
+    await api.post("/api/mood", json={"user_id": user_id, "mood_rating": 4, "energy_level": 3})
+    assert server.user_cache.peek(user_id) is None
+    
+    assert len((await api.get(path)).json()["habits"]) == 2
+
+async def test_cache_holds_only_shared_user_fields(api):
+    user_id = (await api.post("/api/users", json={"username": "narrow", "email": "narrow@example.com"})).json()["id"]
+    server.user_cache.clear()
+    
+    # Reads the cached fields don't cover go straight to storage
+    assert (await api.get(f"/api/stats/{user_id}")).status_code == 200
+    assert server.user_cache.peek(user_id) is None
+    
+    assert (await api.get(f"/api/users/{user_id}")).status_code == 200
+    assert set(server.user_cache.peek(user_id)) == set(server.PROJECTIONS["user_cached"]) - {"_id", "coach_message"}
@@ -0,0 +1,72 @@
+"""Conditional GETs: AI fallbacks must never be pinned by an ETag."""
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+class FlakyCompletions:
+    """chat.completions stand-in that errors until healthy is set"""
+    
+    def __init__(self):
+        self.healthy = False
+    
+    async def create(self, **kwargs):
+        if not self.healthy:
+            raise RuntimeError("model unavailable")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Level up, hero!"))])
+
+@pytest.fixture
+def completions(monkeypatch):
+    completions = FlakyCompletions()
+    monkeypatch.setattr(server, "openai_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return completions
+
+async def test_inline_fallback_dashboard_is_not_tagged(api, completions):
+    user_id = (await api.post("/api/users", json={"username": "etag", "email": "etag@example.com"})).json()["id"]
+    
+    for path in (f"/api/dashboard/{user_id}", f"/api/bootstrap/{user_id}?sections=dashboard"):
+        response = await api.get(path)
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+        assert response.headers["Cache-Control"] == "no-store"
+    assert response.json()["dashboard"]["ai_message"] == server.AI_FALLBACK_MESSAGE
+    assert response.json()["dashboard"]["ai_message_ready"] is False
+    
+    # Once the model answers, the same version is tagged and revalidates
+    completions.healthy = True
+    response = await api.get(f"/api/dashboard/{user_id}")
+    assert response.json()["ai_message"] == "Level up, hero!"
+    etag = response.headers["ETag"]
+    assert (await api.get(f"/api/dashboard/{user_id}", headers={"If-None-Match": etag})).status_code == 304
+
+async def test_deferred_placeholder_is_not_tagged(api, completions):
+    user_id = (await api.post("/api/users", json={"username": "etag", "email": "etag@example.com"})).json()["id"]
+    
+    response = await api.get(f"/api/dashboard/{user_id}", params={"defer_ai": "true"})
+    assert response.json()["ai_message"] == server.COACH_PLACEHOLDER_MESSAGE
+    assert "ETag" not in response.headers
+
+async def test_coach_without_stored_message(api, completions):
+    user_id = (await api.post("/api/users", json={"username": "coach", "email": "coach@example.com"})).json()["id"]
+    
+    response = await api.get(f"/api/coach/{user_id}")
+    assert response.status_code == 200
+    assert response.json() == {"ready": False, "message": None, "token": None}
+    assert (await api.get("/api/coach/missing-user")).status_code == 404
+
+async def test_coach_token_pending_until_model_answers(api, completions):
+    user_id = (await api.post("/api/users", json={"username": "coach", "email": "coach@example.com"})).json()["id"]
+    
+    token = (await api.get(f"/api/dashboard/{user_id}", params={"defer_ai": "true"})).json()["ai_message_token"]
+    response = await api.get(f"/api/coach/{user_id}", params={"token": token})
+    assert response.status_code == 200
+    assert response.json() == {"ready": False, "message": None, "token": token}
+    
+    # The next deferred load schedules another refresh, which now succeeds
+    completions.healthy = True
+    await api.get(f"/api/dashboard/{user_id}", params={"defer_ai": "true"})
+    response = await api.get(f"/api/coach/{user_id}", params={"token": token})
+    assert response.json() == {"ready": True, "message": "Level up, hero!", "token": token}
@@ -0,0 +1,45 @@
+"""Request instrumentation: the per-request query log and /api/metrics."""
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_queries_are_logged_per_request(api, query_log, create_user):
+    user_id, _ = await create_user(api, 3)
+    server.active_habits_cache.clear()
+    
+    await api.get(f"/api/habits/{user_id}")
+    method, route, metrics = query_log.requests[-1]
+    assert (method, route) == ("GET", "/api/habits/{user_id}")
+    assert [label for label, _ in metrics.queries] == ["habits.find", "habit_completions.find"]
+    assert metrics.phases["db"] > 0
+    assert metrics.phases["serialize"] > 0
+
+async def test_cursor_iteration_counts_as_one_query(api, query_log, create_user):
+    user_id, _ = await create_user(api, 3)
+    await api.post("/api/mood", json={"user_id": user_id, "mood_rating": 4, "energy_level": 4})
+    
+    response = await api.get(f"/api/users/{user_id}/export")
+    assert len(response.content.splitlines()) == 5
+    _, route, metrics = query_log.requests[-1]
+    assert route == "/api/users/{user_id}/export"
+    assert [label for label, _ in metrics.queries] == [
+        "users.find_one", "habits.find", "habit_completions.find", "mood_entries.find"
+    ]
+
+async def test_metrics_endpoint_renders_route_series(api, query_log, create_user):
+    user_id, _ = await create_user(api, 2)
+    server.active_habits_cache.clear()
+    await api.get(f"/api/habits/{user_id}")
+    await api.get("/api/users/missing")
+    
+    response = await api.get("/api/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    habits = 'method="GET",route="/api/habits/{user_id}"'
+    assert f"habitverse_request_db_queries_sum{{{habits}}} 2" in lines
+    assert f'habitverse_request_db_queries_bucket{{{habits},le="2"}} 1' in lines
+    assert f'habitverse_request_duration_seconds_count{{{habits}}} 1' in lines
+    assert 'habitverse_requests_total{method="GET",route="/api/users/{user_id}",status="404"} 1' in lines
+    assert 'habitverse_requests_total{method="POST",route="/api/habits",status="200"} 2' in lines
@@ -0,0 +1,117 @@
+"""Query budgets for the hot endpoints.
+
+Each budget is measured with cold document caches, so it covers the worst
+case, and is checked at several habit counts where the cost must not grow
+with the number of habits.
+"""
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+def cold_caches():
+    server.user_cache.clear()
+    server.active_habits_cache.clear()
+
+@pytest.mark.parametrize("habit_count", [1, 10, 50])
+async def test_get_user_habits_budget(api, query_log, habit_count, create_user):
+    user_id, habit_ids = await create_user(api, habit_count)
+    for habit_id in habit_ids[::2]:
+        await api.post(f"/api/habits/{habit_id}/complete", json={"user_id": user_id, "habit_id": habit_id})
+    cold_caches()
+    
+    with query_log.budget(2):
+        response = await api.get(f"/api/habits/{user_id}")
+    assert response.status_code == 200
+    assert len(response.json()) == habit_count
+
+async def test_get_user_habits_warm_cache_budget(api, query_log, create_user):
+    user_id, _ = await create_user(api, 5)
+    await api.get(f"/api/habits/{user_id}")
+    
+    with query_log.budget(1):
+        response = await api.get(f"/api/habits/{user_id}")
+    assert response.status_code == 200
+
+@pytest.mark.parametrize("habit_count", [1, 10, 50])
+async def test_complete_habit_budget(api, query_log, habit_count, create_user):
+    user_id, habit_ids = await create_user(api, habit_count)
+    cold_caches()
+    
+    # habits, insert completion, rollup, user update, achievement award
+    with query_log.budget(5):
+        response = await api.post(
+            f"/api/habits/{habit_ids[0]}/complete", json={"user_id": user_id, "habit_id": habit_ids[0]}
+        )
+    assert response.json()["message"] == "Habit completed successfully!"
+
+async def test_complete_habit_again_budget(api, query_log, create_user):
+    user_id, habit_ids = await create_user(api, 3)
+    body = {"user_id": user_id, "habit_id": habit_ids[0]}
+    await api.post(f"/api/habits/{habit_ids[0]}/complete", json=body)
+    
+    # Rejected by the unique index before any user write
+    with query_log.budget(2):
+        response = await api.post(f"/api/habits/{habit_ids[0]}/complete", json=body)
+    assert response.json()["message"] == "Habit already completed today"
+
+@pytest.mark.parametrize("item_count", [1, 10, 50])
+async def test_batch_completion_budget(api, query_log, item_count, create_user):
+    user_id, habit_ids = await create_user(api, item_count)
+    cold_caches()
+    
+    with query_log.budget(5):
+        response = await api.post("/api/completions/batch", json={
+            "user_id": user_id, "items": [{"habit_id": habit_id} for habit_id in habit_ids]
+        })
+    assert response.json()["completed"] == item_count
+
+@pytest.mark.parametrize("habit_count", [1, 10, 50])
+async def test_dashboard_budget(api, query_log, habit_count, create_user):
+    user_id, habit_ids = await create_user(api, habit_count)
+    await api.post(f"/api/habits/{habit_ids[0]}/complete", json={"user_id": user_id, "habit_id": habit_ids[0]})
+    await api.post("/api/mood", json={"user_id": user_id, "mood_rating": 4, "energy_level": 3})
+    cold_caches()
+    
+    # version check, user, habits, today's completions, recent moods
+    with query_log.budget(5):
+        response = await api.get(f"/api/dashboard/{user_id}")
+    assert response.status_code == 200
+    assert response.json()["total_habits"] == habit_count
+
+async def test_dashboard_not_modified_budget(api, query_log, create_user):
+    user_id, _ = await create_user(api, 3)
+    etag = (await api.get(f"/api/dashboard/{user_id}")).headers["etag"]
+    
+    with query_log.budget(1):
+        response = await api.get(f"/api/dashboard/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+async def test_analytics_budget(api, query_log, create_user):
+    user_id, habit_ids = await create_user(api, 5)
+    await api.post(f"/api/habits/{habit_ids[0]}/complete", json={"user_id": user_id, "habit_id": habit_ids[0]})
+    cold_caches()
+    
+    # version check, rollup facet, user streak
+    with query_log.budget(3):
+        response = await api.get(f"/api/analytics/{user_id}")
+    assert response.json()["total_completions"] == 1
+
+async def test_log_mood_budget(api, query_log, create_user):
+    user_id, _ = await create_user(api, 1)
+    cold_caches()
+    
+    # insert, rollup, user update, achievement award
+    with query_log.budget(4):
+        response = await api.post("/api/mood", json={"user_id": user_id, "mood_rating": 4, "energy_level": 3})
+    assert response.status_code == 200
+
+async def test_bootstrap_budget(api, query_log, create_user):
+    user_id, _ = await create_user(api, 10)
+    cold_caches()
+    
+    # version check, user, habits, today's completions, recent moods, rollup facet
+    with query_log.budget(6):
+        response = await api.get(f"/api/bootstrap/{user_id}")
+    assert set(response.json()) == set(server.BOOTSTRAP_SECTIONS)
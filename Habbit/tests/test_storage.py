@@ -0,0 +1,285 @@
+"""Storage engine contract: the same API flows must behave identically on
+the Motor engine (over mongomock) and the in-memory engine.
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import uuid
+
+import pytest
+
+import server
+from storage import day_key
+
+pytestmark = pytest.mark.anyio
+
+async def test_complete_habit_once_per_day(engine_api, create_user):
+    user_id, habit_ids = await create_user(engine_api)
+    body = {"user_id": user_id, "habit_id": habit_ids[0]}
+    
+    first = (await engine_api.post(f"/api/habits/{habit_ids[0]}/complete", json=body)).json()
+    second = (await engine_api.post(f"/api/habits/{habit_ids[0]}/complete", json=body)).json()
+    assert first["xp_earned"] == 20
+    assert first["current_streak"] == 1
+    assert second == {"message": "Habit already completed today", "xp_earned": 0}
+    
+    habits = (await engine_api.get(f"/api/habits/{user_id}")).json()
+    assert [h["completed_today"] for h in habits] == [True, False]
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["total_habits_completed"] == 1
+    assert stats["week_completions"] == 1
+    assert stats["active_habits"] == 2
+    assert stats["category_completions"] == {"fitness": 1}
+
+async def test_inactive_habit_not_counted_as_active(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=4)
+    response = await engine_api.post("/api/habits", json={
+        "user_id": user_id, "name": "paused", "description": "", "category": "sleep",
+        "difficulty": 1, "is_active": False
+    })
+    assert response.json()["is_active"] is False
+    assert response.json()["new_achievements"] == []
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["active_habits"] == 4
+    assert "habit_collector" not in (await engine_api.get(f"/api/users/{user_id}")).json()["achievements"]
+    assert await server.repair_user_counters(user_id, dry_run=True) == {"users_checked": 1, "users_repaired": 0}
+
+async def test_batch_completion_statuses(engine_api, create_user):
+    user_id, habit_ids = await create_user(engine_api)
+    await engine_api.post(f"/api/habits/{habit_ids[0]}/complete", json={"user_id": user_id, "habit_id": habit_ids[0]})
+    
+    response = await engine_api.post("/api/completions/batch", json={"user_id": user_id, "items": [
+        {"habit_id": habit_ids[0]}, {"habit_id": habit_ids[1]}, {"habit_id": habit_ids[1]}, {"habit_id": "missing"}
+    ]})
+    result = response.json()
+    assert [r["status"] for r in result["results"]] == ["already_completed", "completed", "already_completed", "not_found"]
+    assert result["completed"] == 1
+    assert result["xp_earned"] == 20
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["category_completions"] == {"fitness": 1, "deep_work": 1}
+
+async def test_mood_history_pages_newest_first(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    start = datetime.utcnow() - timedelta(hours=1)
+    for i in range(5):
+        await engine_api.post("/api/mood", json={
+            "user_id": user_id, "mood_rating": i % 5 + 1, "energy_level": 3,
+            "created_at": (start + timedelta(minutes=i)).isoformat()
+        })
+    
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = (await engine_api.get(f"/api/mood/{user_id}/history", params=params)).json()
+        seen.extend(item["mood_rating"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["mood_trend"] == [5, 4, 3, 2, 1]
+    assert stats["mood_entries"] == 5
+
+async def test_mood_history_cursor_with_offset(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+    for i in range(3):
+        await engine_api.post("/api/mood", json={
+            "user_id": user_id, "mood_rating": i + 1, "energy_level": 3,
+            "created_at": (start + timedelta(minutes=i)).isoformat()
+        })
+    newest = (await engine_api.get(f"/api/mood/{user_id}/history", params={"limit": 1})).json()["items"][0]
+    
+    # The same position written with a -05:00 offset must page like the naive UTC cursor
+    moment = datetime.fromisoformat(newest["created_at"]).replace(tzinfo=timezone.utc)
+    cursor = server.encode_page_cursor(moment.astimezone(timezone(timedelta(hours=-5))), newest["id"])
+    response = await engine_api.get(f"/api/mood/{user_id}/history", params={"cursor": cursor})
+    assert response.status_code == 200
+    assert [item["mood_rating"] for item in response.json()["items"]] == [2, 1]
+
+async def test_offset_timestamps_stored_as_utc(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    for created_at in ("2026-10-16T23:30:00-05:00", "2026-10-17T03:00:00", "2026-10-17T05:00:00+01:00"):
+        response = await engine_api.post("/api/mood", json={
+            "user_id": user_id, "mood_rating": 3, "energy_level": 3, "created_at": created_at
+        })
+        assert response.status_code == 200
+    
+    page = (await engine_api.get(f"/api/mood/{user_id}/history")).json()
+    assert [item["created_at"] for item in page["items"]] == [
+        "2026-10-17T04:30:00", "2026-10-17T04:00:00", "2026-10-17T03:00:00"
+    ]
+    assert (await engine_api.get(f"/api/stats/{user_id}")).json()["mood_entries"] == 3
+
+async def test_mood_rollup_day_matches_rebuild(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    yesterday = (datetime.utcnow() - timedelta(days=1)).replace(hour=4, minute=30, second=0, microsecond=0)
+    # 23:30 at -05:00 the day before is 04:30 UTC yesterday
+    local = (yesterday - timedelta(hours=5)).isoformat() + "-05:00"
+    response = await engine_api.post("/api/mood", json={
+        "user_id": user_id, "mood_rating": 2, "energy_level": 5, "created_at": local
+    })
+    assert response.json()["created_at"] == yesterday.isoformat()
+    
+    async def mood_days():
+        analytics = (await engine_api.get(f"/api/analytics/{user_id}")).json()
+        return {day["date"]: day["mood"] for day in analytics["daily_data"] if day["mood"] is not None}
+    
+    live = await mood_days()
+    assert live == {day_key(yesterday): 2}
+    await server.rebuild_daily_rollups(user_id)
+    assert await mood_days() == live
+
+async def test_backdated_mood_keeps_latest_for_day(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    yesterday = (datetime.utcnow() - timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    for mood_rating, hour in ((5, 12), (1, 6)):
+        await engine_api.post("/api/mood", json={
+            "user_id": user_id, "mood_rating": mood_rating, "energy_level": mood_rating,
+            "created_at": yesterday.replace(hour=hour).isoformat()
+        })
+    
+    async def mood_day():
+        analytics = (await engine_api.get(f"/api/analytics/{user_id}")).json()
+        day = next(day for day in analytics["daily_data"] if day["date"] == day_key(yesterday))
+        return day["mood"], day["energy"], analytics["avg_mood"]
+    
+    live = await mood_day()
+    assert live == (5, 5, 3)
+    await server.rebuild_daily_rollups(user_id)
+    assert await mood_day() == live
+
+async def test_analytics_and_conditional_requests(engine_api, create_user):
+    user_id, habit_ids = await create_user(engine_api)
+    await engine_api.post(f"/api/habits/{habit_ids[0]}/complete", json={"user_id": user_id, "habit_id": habit_ids[0]})
+    await engine_api.post("/api/mood", json={"user_id": user_id, "mood_rating": 4, "energy_level": 2})
+    
+    response = await engine_api.get(f"/api/analytics/{user_id}")
+    analytics = response.json()
+    assert analytics["total_completions"] == 1
+    assert analytics["avg_mood"] == 4
+    assert analytics["avg_energy"] == 2
+    today = next(day for day in analytics["daily_data"] if day["date"] == day_key(datetime.utcnow()))
+    assert (today["completions"], today["mood"]) == (1, 4)
+    
+    etag = response.headers["ETag"]
+    assert (await engine_api.get(f"/api/analytics/{user_id}", headers={"If-None-Match": etag})).status_code == 304
+    await engine_api.post("/api/mood", json={"user_id": user_id, "mood_rating": 1, "energy_level": 1})
+    assert (await engine_api.get(f"/api/analytics/{user_id}", headers={"If-None-Match": etag})).status_code == 200
+
+async def test_export_import_round_trip(engine_api, create_user):
+    user_id, habit_ids = await create_user(engine_api)
+    await engine_api.post("/api/completions/batch", json={"user_id": user_id, "items": [{"habit_id": h} for h in habit_ids]})
+    await engine_api.post("/api/mood", json={"user_id": user_id, "mood_rating": 3, "energy_level": 3})
+    export = (await engine_api.get(f"/api/users/{user_id}/export")).content
+    
+    target = (await engine_api.post("/api/users", json={"username": "copy", "email": "copy@example.com"})).json()["id"]
+    result = (await engine_api.post(f"/api/users/{target}/import", content=export)).json()
+    # Ids are global, so re-importing the same history anywhere is a no-op
+    assert result["inserted"] == {"habit": 0, "completion": 0, "mood": 0}
+    assert result["skipped_duplicates"] == {"habit": 2, "completion": 2, "mood": 1}
+    
+    lines = (await engine_api.get(f"/api/users/{user_id}/export")).content.splitlines()
+    assert [line.split(b'"type":"')[1].split(b'"')[0] for line in lines] == [
+        b"user", b"habit", b"habit", b"completion", b"completion", b"mood"
+    ]
+
+async def test_import_rebuilds_derived_state(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    noon = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    fitness, focus = str(uuid.uuid4()), str(uuid.uuid4())
+    
+    def record(record_type, **data):
+        return json.dumps({"type": record_type, "data": data}, default=str)
+    
+    def completion(habit_id, days_ago):
+        return record("completion", id=str(uuid.uuid4()), habit_id=habit_id, xp_earned=20,
+                      completed_at=(noon - timedelta(days=days_ago)).isoformat())
+    
+    lines = [
+        record("user", id="someone-else", username="ignored"),
+        record("habit", id=fitness, name="Run", description="", category="fitness", difficulty=2, xp_reward=20),
+        record("habit", id=focus, name="Read", description="", category="Deep Work", difficulty=2, xp_reward=20),
+        "",
+        completion(fitness, 2), completion(fitness, 1), completion(fitness, 0), completion(focus, 1),
+        record("mood", id=str(uuid.uuid4()), mood_rating=2, energy_level=4,
+               created_at=(noon - timedelta(days=1)).isoformat()),
+        "{not json",
+        record("badge", id="x"),
+        record("completion", id=str(uuid.uuid4()), habit_id=fitness),
+    ]
+    result = (await engine_api.post(f"/api/users/{user_id}/import", content="\n".join(lines))).json()
+    
+    assert result["inserted"] == {"habit": 2, "completion": 4, "mood": 1}
+    assert result["skipped_duplicates"] == {"habit": 0, "completion": 0, "mood": 0}
+    assert result["invalid_lines"] == 3
+    assert [error["line"] for error in result["errors"]] == [10, 11, 12]
+    assert [a["name"] for a in result["new_achievements"]] == ["Baby Steps"]
+    
+    user = (await engine_api.get(f"/api/users/{user_id}")).json()
+    assert user["total_xp"] == 80 + 50
+    assert (user["current_streak"], user["longest_streak"]) == (3, 3)
+    assert user["achievements"] == ["first_habit"]
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["total_habits_completed"] == 4
+    assert stats["active_habits"] == 2
+    assert stats["mood_entries"] == 1
+    assert stats["category_completions"] == {"fitness": 3, "deep_work": 1}
+    
+    analytics = (await engine_api.get(f"/api/analytics/{user_id}")).json()
+    assert (analytics["total_completions"], analytics["total_xp"]) == (4, 80)
+    assert analytics["avg_mood"] == 2
+    by_date = {day["date"]: day for day in analytics["daily_data"]}
+    assert by_date[day_key(noon - timedelta(days=1))]["completions"] == 2
+    assert by_date[day_key(noon - timedelta(days=1))]["mood"] == 2
+    assert by_date[day_key(noon)]["xp_earned"] == 20
+    
+    habits = (await engine_api.get(f"/api/habits/{user_id}")).json()
+    assert {h["id"]: h["completed_today"] for h in habits} == {fitness: True, focus: False}
+
+async def test_streak_rules(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    users = server.storage.users
+    projection = {"_id": 0, "current_streak": 1, "longest_streak": 1, "category_completions": 1, "total_xp": 1}
+    today = datetime.utcnow()
+    
+    streaks = []
+    for offset in (3, 2, 2, 1, -1):
+        day = day_key(today - timedelta(days=offset))
+        user = await users.apply_completions(user_id, day, 10, {"fitness": 1}, projection)
+        streaks.append((user["current_streak"], user["longest_streak"]))
+    assert streaks == [(1, 1), (2, 2), (2, 2), (3, 3), (1, 3)]
+    assert user["category_completions"] == {"fitness": 5}
+    assert user["total_xp"] == 50
+    assert await users.apply_completions("missing", day_key(today), 10, {}, projection) is None
+
+async def test_award_achievements_per_id(engine_api, create_user):
+    user_id, _ = await create_user(engine_api, habit_count=0)
+    users = server.storage.users
+    projection = {"_id": 0, "achievements": 1, "total_xp": 1, "version": 1}
+    
+    assert await users.award_achievements(user_id, {"first_mood": 10}) == ["first_mood"]
+    # A request racing the first one still gets the ids it alone earned
+    assert await users.award_achievements(user_id, {"first_mood": 10, "mood_tracker": 25}) == ["mood_tracker"]
+    assert await users.award_achievements(user_id, {"mood_tracker": 25}) == []
+    assert await users.get(user_id, projection) == {
+        "achievements": ["first_mood", "mood_tracker"], "total_xp": 35, "version": 2
+    }
+    assert await users.award_achievements("missing", {"first_mood": 10}) == []
+
+async def test_repair_counters_fixes_drift(engine_api, create_user):
+    user_id, habit_ids = await create_user(engine_api)
+    await engine_api.post("/api/completions/batch", json={"user_id": user_id, "items": [{"habit_id": h} for h in habit_ids]})
+    await server.storage.users.set_fields(user_id, {"completions_count": 99, "category_completions": {}})
+    
+    assert await server.repair_user_counters(user_id, dry_run=True) == {"users_checked": 1, "users_repaired": 1}
+    assert await server.repair_user_counters(user_id) == {"users_checked": 1, "users_repaired": 1}
+    assert await server.repair_user_counters(user_id) == {"users_checked": 1, "users_repaired": 0}
+    
+    stats = (await engine_api.get(f"/api/stats/{user_id}")).json()
+    assert stats["total_habits_completed"] == 2
+    assert stats["category_completions"] == {"fitness": 1, "deep_work": 1}